@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+    asynchronous access to datasources and reports (python 3.5.2+)
+
+    the synchronous code (ORM queries, columns) runs in a worker thread and the
+    results are returned to the event loop as futures, so `async for` and `await`
+    do not block the loop. No `async def` is used to keep the module importable
+    by python 2.
+"""
+from collections import deque
+from itertools import islice
+import sys
+from django.db import connections
+
+# __aiter__ returning the iterator and loop.create_future() are available since 3.5.2
+if sys.version_info >= (3, 5, 2):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+else:
+    asyncio = ThreadPoolExecutor = StopAsyncIteration = None
+
+
+def close_connections():
+    """
+        closes the database connections of the current thread
+    """
+    for conn in connections.all():
+        conn.close()
+
+
+def _run_and_close(func, *args):
+    try:
+        return func(*args)
+    finally:
+        close_connections()
+
+
+def run_in_thread(func, *args):
+    """
+        runs `func(*args)` in the default executor of the running loop and
+        closes the database connections used by the thread.
+    :return: asyncio.Future
+    """
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(None, _run_and_close, func, *args)
+
+
+class AsyncIterator(object):
+    """
+        asynchronous iterator over the synchronous iterable returned by `factory()`.
+
+        items are fetched `chunk_size` at time in a dedicated thread (so the same
+        database connection is used for the whole iteration) and served from
+        a buffer until the next chunk is needed.
+    """
+
+    def __init__(self, factory, chunk_size=1000):
+        if asyncio is None:
+            raise RuntimeError("Asynchronous iteration requires python 3.5.2+")
+        self.factory = factory
+        self.chunk_size = chunk_size
+        self._iterator = None
+        self._buffer = deque()
+        self._exhausted = False
+        self._executor = None
+
+    def __aiter__(self):
+        return self
+
+    def _fetch(self):
+        # runs in the worker thread
+        try:
+            if self._iterator is None:
+                self._iterator = iter(self.factory())
+            chunk = list(islice(self._iterator, self.chunk_size))
+        except Exception:
+            close_connections()
+            raise
+        if not chunk:
+            close_connections()
+        return chunk
+
+    def __anext__(self):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        if self._buffer:
+            future.set_result(self._buffer.popleft())
+        elif self._exhausted:
+            future.set_exception(StopAsyncIteration())
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            loop.run_in_executor(self._executor, self._fetch).add_done_callback(
+                lambda fetched: self._set_next(fetched, future))
+        return future
+
+    def _set_next(self, fetched, future):
+        if future.cancelled():
+            return
+        if fetched.exception() is not None:
+            self._shutdown()
+            future.set_exception(fetched.exception())
+            return
+        chunk = fetched.result()
+        if not chunk:
+            self._shutdown()
+            future.set_exception(StopAsyncIteration())
+            return
+        self._buffer.extend(chunk[1:])
+        future.set_result(chunk[0])
+
+    def _shutdown(self):
+        self._exhausted = True
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def aclose(self):
+        """
+            stops the iteration, closing the database connections of the worker thread
+        :return: asyncio.Future
+        """
+        loop = asyncio.get_event_loop()
+        if self._executor is None or self._exhausted:
+            future = loop.create_future()
+            future.set_result(None)
+            return future
+        executor = self._executor
+        future = loop.run_in_executor(executor, close_connections)
+        self._buffer.clear()
+        self._shutdown()
+        return future
@@ -1,18 +1,28 @@
-import hashlib
 from operator import itemgetter
 from django.core.cache import cache as _cache
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from ereports.engine import serializer
+from ereports.engine.fingerprint import get_datasource_fingerprint, get_fingerprint, FingerprintError
 from ereports.utils import fqn, flatten
 
 
 EREPORTS_CACHE_MODELS_PREFIX = 'ereports/models/%s'
+EREPORTS_CACHE_CHANGES_PREFIX = 'ereports/changes/%s/%s'  # primary key of the instance changed by a generation
+EREPORTS_CACHE_TABLES_PREFIX = 'ereports/tables/%s'
+MAX_KEY_LENGTH = 250  # memcached
 
+_monitored_models = set()
+_monitored_tables = set()  # tables read by the cache keys computed by this process
 
-def invalidate(sender, **kwargs):
+
+def invalidate(sender, instance=None, **kwargs):
     try:
-        _cache.incr(EREPORTS_CACHE_MODELS_PREFIX % fqn(sender), 1)
+        generation = _cache.incr(EREPORTS_CACHE_MODELS_PREFIX % fqn(sender), 1)
     except ValueError:
         reset(sender)
+    else:
+        if instance is not None:
+            _cache.set(EREPORTS_CACHE_CHANGES_PREFIX % (fqn(sender), generation), instance.pk)
 
 
 def reset(model, **kwargs):
@@ -23,10 +33,53 @@ def monitor_model(model):
     version = _cache.get(EREPORTS_CACHE_MODELS_PREFIX % fqn(model))
     if version is None:
         reset(model)
+    _monitored_models.add(model)
     post_save.connect(invalidate, sender=model, dispatch_uid="ereports_save_%s" % str(model))
     post_delete.connect(invalidate, sender=model, dispatch_uid="ereports_delete_%s" % str(model))
 
 
+def is_monitored_table(table):
+    """
+        returns True if `table` is read by the cache keys computed by this process
+        or by the registered reports that use the cache (see `Registry.get_tables()`)
+    """
+    from ereports.engine.registry import registry
+    return table in _monitored_tables or table in registry.get_tables()
+
+
+def invalidate_table(sender, instance=None, action=None, **kwargs):
+    """
+        increments the generation of the table of `sender` (many-to-many through models included)
+        and of its multi-table inheritance parents, if they are monitored
+    """
+    if action is not None and not action.startswith('post_'):
+        return
+    parents = list(sender._meta.get_parent_list())
+    for parent in parents:
+        # the model signals are sent only for the saved child
+        if parent in _monitored_models and instance is not None and action is None:
+            invalidate(parent, instance)
+    for model in [sender] + parents:
+        table = model._meta.db_table
+        if not is_monitored_table(table):
+            continue
+        key = EREPORTS_CACHE_TABLES_PREFIX % table
+        try:
+            _cache.incr(key, 1)
+        except ValueError:
+            # a missing generation is read as 0
+            _cache.add(key, 1)
+
+
+# connected for every model at startup: the tables read by a datasource are known only when
+# its query is built, and may be changed by processes that never build it.
+# Only the tables of the registered reports and of the keys computed by the process are invalidated:
+# the other writes do not reach the cache
+post_save.connect(invalidate_table, dispatch_uid="ereports_table_save")
+post_delete.connect(invalidate_table, dispatch_uid="ereports_table_delete")
+m2m_changed.connect(invalidate_table, dispatch_uid="ereports_table_m2m")
+
+
 class BaseCacheManager(object):
     def store(self, key, value, timeout=None, version=None):
         _cache.set(key, value, timeout, version)
@@ -51,9 +104,32 @@ class BaseCacheManager(object):
         prefix = fqn(model)
         return prefix, self.get_last_cache_version(model)
 
+    def get_table_gen_part(self, table):
+        """
+            returns a tuple composed by 'table name', 'generation value'
+        """
+        return table, _cache.get(EREPORTS_CACHE_TABLES_PREFIX % table, 0)
+
     def get_key(self, target):
         raise NotImplementedError()
 
+    def load(self, datasource):
+        """
+            returns the cached result of `datasource` or None
+        """
+        key = self.get_key(datasource)
+        if key is None:
+            return None
+        return self.retrieve(key)
+
+    def save(self, datasource, result):
+        """
+            caches `result` as result of `datasource`
+        """
+        key = self.get_key(datasource)
+        if key is not None:
+            self.store(key, result)
+
 
 class DummyCacheManager(BaseCacheManager):
     def store(self, key, value, timeout=None, version=None):
@@ -70,20 +146,131 @@ class DummyCacheManager(BaseCacheManager):
 
 
 class DatasourceCacheManager(BaseCacheManager):
+    """
+        stores the results of the datasources in the django cache, serialized with
+        `ereports.engine.serializer`
+    """
+
+    def load(self, datasource):
+        key = self.get_key(datasource)
+        if key is None:
+            return None
+        data = self.retrieve(key)
+        if data is None:
+            return None
+        return serializer.loads(data, datasource)
+
+    def save(self, datasource, result):
+        key = self.get_key(datasource)
+        if key is not None:
+            self.store(key, serializer.dumps(result))
+
     def get_key(self, datasource):
-        parts = [self.get_model_gen_part(datasource.model)]
+        parts = [self.get_model_gen_part(datasource.model)] if datasource.model is not None else []
+        return self._get_key(datasource, parts)
 
+    def _get_key(self, datasource, parts):
+        """
+            returns the cache key of `datasource`, or None if it cannot be cached
+            (ie. a filter is a bound method, see `canonical()`)
+        """
+        try:
+            fingerprint = get_datasource_fingerprint(datasource)
+        except FingerprintError:
+            return None
         if datasource.dependent_models:
             for model in datasource.dependent_models:
                 parts.append(self.get_model_gen_part(model))
 
         parts = sorted(parts, key=itemgetter(0))
         parts.insert(0, ('ereports', _cache.get('ereports', 1)))  # to invalidate whole ereports cache
-
-        m = hashlib.md5()
-        m.update("{0}-{1}-{2}-{3}".format(str(datasource.columns), str(datasource.kwfilters),
-                                          str(datasource.filters), str(datasource.order_by)))
-        parts.append(m.hexdigest())
+        tables = sorted(self.get_tables(datasource))
+        _monitored_tables.update(tables)
+        # the length of the key does not depend on the number of tables
+        parts.append(get_fingerprint([self.get_table_gen_part(table) for table in tables], fingerprint))
         key = "/".join(map(str, flatten(parts)))
-
+        if len(key) > MAX_KEY_LENGTH:
+            key = "ereports/%s" % get_fingerprint(key)
         return key
+
+    def get_tables(self, datasource):
+        """
+            returns the tables read by the query of `datasource` (joins and subqueries included)
+        """
+        return datasource.get_dependent_tables() or []
+
+
+class IncrementalCacheManager(DatasourceCacheManager):
+    """
+        cache manager that patches the cached result when instances of the datasource
+        model are saved or deleted, instead of discarding it.
+
+        the key does not depend on the generation of the datasource model: the result is
+        stored with the generation it reflects and, when loaded, the rows of the instances
+        changed since then (see `invalidate`) are evaluated again (see `Datasource.patch_result()`).
+        Changes of the `dependent_models` and of the other tables read by the query
+        still invalidate the whole result.
+
+        The generation read by `load()` is kept by the datasource (`_cache_generation`):
+        the manager is shared by the datasources and their clones.
+    """
+    max_changes = 1000  # above this number of changes the result is computed again
+
+    def __init__(self):
+        self._monitored = set()
+
+    def get_key(self, datasource):
+        # the key does not change when the model does: the changes must be recorded
+        if datasource.model not in self._monitored:
+            monitor_model(datasource.model)
+            self._monitored.add(datasource.model)
+        return self._get_key(datasource, [(fqn(datasource.model), 'incremental')])
+
+    def get_tables(self, datasource):
+        # changes of the datasource model are patched, not invalidated
+        table = datasource.model._meta.db_table
+        return [t for t in super(IncrementalCacheManager, self).get_tables(datasource) if t != table]
+
+    def get_changes(self, model, since, generation):
+        """
+            returns the set of the primary keys changed after generation `since`
+            up to `generation`, or None if the changes are not available
+        """
+        if since > generation or generation - since > self.max_changes:
+            return None
+        keys = [EREPORTS_CACHE_CHANGES_PREFIX % (fqn(model), gen) for gen in range(since + 1, generation + 1)]
+        changes = _cache.get_many(keys)
+        if len(changes) < len(keys):
+            return None
+        return set(changes.values())
+
+    def load(self, datasource):
+        key = self.get_key(datasource)
+        if key is None:
+            return None
+        # changes made while the result is computed are patched by the next load
+        generation = datasource._cache_generation = self.get_last_cache_version(datasource.model)
+        entry = self.retrieve(key)
+        if entry is None:
+            return None
+        since, data = entry
+        result = serializer.loads(data, datasource)
+        if result is None or since == generation:
+            return result
+        pks = self.get_changes(datasource.model, since, generation)
+        if pks is None:
+            return None
+        result = datasource.patch_result(result, pks)
+        if result is not None:
+            self.store(key, (generation, serializer.dumps(result)))
+        return result
+
+    def save(self, datasource, result):
+        key = self.get_key(datasource)
+        if key is None:
+            return
+        generation, datasource._cache_generation = datasource._cache_generation, None
+        if generation is None:
+            # not computed after a load: the generation of the rows is unknown
+            return
+        self.store(key, (generation, serializer.dumps(result)))
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+from array import array
+import datetime
+from six import integer_types, string_types
+from ereports.engine.columns import RowValue
+
+
+def _is_bool(value):
+    return isinstance(value, bool)
+
+
+def _is_int(value):
+    return isinstance(value, integer_types) and not isinstance(value, bool)
+
+
+def _is_float(value):
+    return isinstance(value, float)
+
+
+def _is_date(value):
+    return isinstance(value, datetime.date) and not isinstance(value, datetime.datetime)
+
+
+def _is_string(value):
+    return isinstance(value, string_types)
+
+
+# (kind, test, array typecode)
+KINDS = (('bool', _is_bool, 'b'),
+         ('int', _is_int, 'l'),
+         ('float', _is_float, 'd'),
+         ('date', _is_date, 'l'),
+         ('str', _is_string, 'i'))
+
+NUMERIC_KINDS = ('bool', 'int', 'float')
+
+
+def _get_kind(values):
+    """
+        returns (kind, typecode) of the not null `values`. Mixed or unknown types
+        are stored as 'object' in a plain list.
+
+        >>> _get_kind([1, None, 2])
+        ('int', 'l')
+        >>> _get_kind([1, 'a'])
+        ('object', None)
+    """
+    sample = [v for v in values if v is not None]
+    for kind, test, typecode in KINDS:
+        if sample and all(test(v) for v in sample):
+            return kind, typecode
+    return 'object', None
+
+
+class Vector(object):
+    """
+        the values of a column: a typed `array` for the numeric, date and boolean
+        values, an array of codes plus the list of the distinct values for the strings
+        and a plain list for everything else.
+
+        None values are tracked in `nulls` (a bytearray mask), the cells that could not
+        be computed (RowValueError) are kept in `errors` {index: error}.
+
+        >>> v = Vector.from_values(['a', 'b', None, 'a'])
+        >>> v.kind, list(v.data), v.labels
+        ('str', [0, 1, 0, 0], ['a', 'b'])
+        >>> v.tolist()
+        ['a', 'b', None, 'a']
+    """
+    __slots__ = ('kind', 'data', 'labels', 'nulls', 'errors')
+
+    def __init__(self, kind, data, labels=None, nulls=None, errors=None):
+        self.kind = kind
+        self.data = data
+        self.labels = labels
+        self.nulls = nulls
+        self.errors = errors or {}
+
+    @classmethod
+    def from_cells(cls, cells):
+        """
+            creates a Vector from a list of RowValue (or RowValueError) instances
+        """
+        errors = {}
+        values = []
+        for i, cell in enumerate(cells):
+            if isinstance(cell, RowValue):
+                values.append(cell.value)
+            else:
+                errors[i] = cell
+                values.append(None)
+        vector = cls.from_values(values)
+        vector.errors = errors
+        return vector
+
+    @classmethod
+    def from_values(cls, values):
+        kind, typecode = _get_kind(values)
+        nulls = None
+        if None in values:
+            nulls = bytearray(1 if v is None else 0 for v in values)
+
+        if kind == 'object':
+            return cls(kind, list(values))
+        elif kind == 'str':
+            codes = {}
+            labels = []
+            data = array(typecode)
+            for v in values:
+                if v is None:
+                    data.append(0)
+                    continue
+                try:
+                    data.append(codes[v])
+                except KeyError:
+                    code = codes[v] = len(labels)
+                    labels.append(v)
+                    data.append(code)
+            return cls(kind, data, labels=labels, nulls=nulls)
+        elif kind == 'date':
+            return cls(kind, array(typecode, [0 if v is None else v.toordinal() for v in values]), nulls=nulls)
+        try:
+            return cls(kind, array(typecode, [0 if v is None else v for v in values]), nulls=nulls)
+        except OverflowError:
+            return cls('object', list(values))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        value = self.data[i]
+        if self.kind == 'str':
+            return self.labels[value]
+        elif self.kind == 'date':
+            return datetime.date.fromordinal(value)
+        elif self.kind == 'bool':
+            return bool(value)
+        return value
+
+    def cell(self, i, column=None):
+        """
+            returns the RowValue (or the RowValueError) at index `i`
+        """
+        if self.errors and i in self.errors:
+            return self.errors[i]
+        return RowValue(self[i], column)
+
+    def tolist(self, indices=None):
+        if indices is None:
+            indices = range(len(self))
+        return [self[i] for i in indices]
+
+    def sum(self, indices=None):
+        """
+            returns the total of the values at `indices` (default all), with the same
+            semantic of `ereports.engine.report.accumulate`: None values count as 0,
+            not numeric values set the total to None.
+        """
+        if self.kind in NUMERIC_KINDS and not self.errors:
+            # null values are stored as 0
+            if indices is None:
+                return sum(self.data)
+            data = self.data
+            return sum(data[i] for i in indices)
+
+        total = 0
+        for value in self.tolist(indices):
+            try:
+                total += (value or 0)
+            except TypeError:
+                return None
+        return total
+
+    def group_indices(self, indices=None):
+        """
+            returns a dictionary {value: array of the indices with that value}
+        """
+        if indices is None:
+            indices = range(len(self))
+        groups = {}
+        if self.kind == 'str':
+            # group by code, then translate the codes
+            data, nulls = self.data, self.nulls
+            by_code = {}
+            for i in indices:
+                key = None if nulls is not None and nulls[i] else data[i]
+                by_code.setdefault(key, array('l')).append(i)
+            for code, idx in by_code.items():
+                groups[None if code is None else self.labels[code]] = idx
+            return groups
+        for i in indices:
+            groups.setdefault(self[i], array('l')).append(i)
+        return groups
+
+    def argsort(self, indices=None):
+        """
+            returns the `indices` (default all) sorted by value
+        """
+        if indices is None:
+            indices = range(len(self))
+        if self.kind == 'str' and self.nulls is None:
+            # sort the labels once, then the codes
+            ranks = array('i', [0] * len(self.labels))
+            for rank, code in enumerate(sorted(range(len(self.labels)), key=self.labels.__getitem__)):
+                ranks[code] = rank
+            data = self.data
+            return sorted(indices, key=lambda i: ranks[data[i]])
+        return sorted(indices, key=self.__getitem__)
+
+    def __getstate__(self):
+        return self.kind, self.data, self.labels, self.nulls, self.errors
+
+    def __setstate__(self, state):
+        self.kind, self.data, self.labels, self.nulls, self.errors = state
+
+    def __repr__(self):
+        return "<Vector %s: %d values>" % (self.kind, len(self))
+
+
+class ColumnarResult(object):
+    """
+        materialized result of a Datasource stored by column (see `Datasource.columnar`).
+
+        Behaves as the tuple of DatasourceRow used by default: rows are rebuilt when
+        accessed and their `_original` is None, so the records are not kept in memory.
+        Totals, groups and sorting can be computed on the columns with `sum()`,
+        `group_indices()` and `argsort()`.
+    """
+
+    def __init__(self, header, vectors, RowClass, columns=None):
+        self.header = header
+        self.vectors = vectors
+        self.RowClass = RowClass
+        self.columns = dict((c.name, c) for c in columns or [])
+        self._length = len(vectors[0]) if vectors else 0
+
+    @classmethod
+    def from_rows(cls, header, rows, RowClass, columns=None):
+        """
+            creates a ColumnarResult consuming `rows`, an iterable of DatasourceRow
+        """
+        cells = [[] for __ in header.names]
+        for row in rows:
+            for i, cell in enumerate(row.itervalues()):
+                cells[i].append(cell)
+        return cls(header, [Vector.from_cells(c) for c in cells], RowClass, columns)
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self.row(i)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return tuple(self.row(i) for i in range(*k.indices(self._length)))
+        if k < 0:
+            k += self._length
+        if not 0 <= k < self._length:
+            raise IndexError("ColumnarResult index out of range")
+        return self.row(k)
+
+    def vector(self, name):
+        return self.vectors[self.header.index[name]]
+
+    def row(self, i, header=None):
+        """
+            returns the DatasourceRow at index `i` with the columns of `header`, default all
+        """
+        header = header or self.header
+        values = [self.vector(name).cell(i, self.columns.get(name)) for name in header.names]
+        return self.RowClass(header=header, values=values)
+
+    def values(self, name, indices=None):
+        """
+            returns the list of the values of the column `name`
+        """
+        return self.vector(name).tolist(indices)
+
+    def sum(self, name, indices=None):
+        return self.vector(name).sum(indices)
+
+    def group_indices(self, name, indices=None):
+        return self.vector(name).group_indices(indices)
+
+    def argsort(self, name, indices=None):
+        return self.vector(name).argsort(indices)
+
+    def __getstate__(self):
+        return self.header, self.vectors, self.RowClass
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return "<ColumnarResult: %d rows %s>" % (self._length, self.header.names)
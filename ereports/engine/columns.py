@@ -2,20 +2,31 @@
 from decimal import Decimal
 import re
 import operator
-import logging
 import datetime
 from django.utils.encoding import smart_str
-from six import text_type, string_types
+from six import text_type, string_types, integer_types, get_unbound_function
+from ereports.engine.errors import record_error
 from ereports.engine.widgets import ColumnWidget, CurrencyWidget, YesNoWidget, DateWidget, TimeWidget
 from django.db import models
-from ereports.utils import get_verbose_name, get_field_from_path, get_attr
+from ereports.utils import get_verbose_name, get_field_from_path, attr_getter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 __all__ = ['Column', 'DecimalColumn', 'DateColumn', 'DateTimeColumn', 'TimeColumn', 'IntegerColumn', 'BooleanColumn']
 
 NOTFOUND = object()
+# elementwise operations that `CalcColumn` can evaluate on whole columns with numpy
+VECTOR_OPS = (operator.add, operator.sub, operator.mul)
+MAXINT = 2 ** 63 - 1
 rex = re.compile(r'^(\d|_)+')
-logger = logging.getLogger(__name__)
+
+
+def identity(value):
+    return value
 
 
 def normalize_name(attr):
@@ -28,6 +39,8 @@ class RowValueError(Exception):
 
 
 class RowValue(object):
+    __slots__ = ('value', 'column')
+
     def __init__(self, value, column=None):
         self.value = value
         self.column = column
@@ -50,9 +63,11 @@ class RowValue(object):
         return not self.__eq__(other)
 
     def __getstate__(self):
-        obj_dict = self.__dict__.copy()
-        obj_dict['column'] = None
-        return obj_dict
+        return (self.value, )
+
+    def __setstate__(self, state):
+        self.value, = state
+        self.column = None
 
 
 class Column(object):
@@ -67,7 +82,8 @@ class Column(object):
         self.name = name or normalize_name(attr)
         self._title = title
         self.format = format or self.default_format
-        self._manipulator = manipulator or (lambda x: x)
+        self._manipulator = manipulator or identity
+        self._getters = {}
         self.model = model
         if widget:
             self.widget = widget
@@ -82,11 +98,41 @@ class Column(object):
         value = self._get_value_from_attr(obj, self.attr, datasource)
         return RowValue(value, self)
 
+    def get_cells(self, objects, datasource):
+        """
+            returns the cells of the column for a batch of `objects`: RowValue with the
+            manipulator applied, or RowValueError if the value cannot be computed.
+            Errors are counted by `datasource.errors` (see `ereports.engine.errors`).
+        """
+        cells = []
+        for obj in objects:
+            try:
+                cells.append(self.apply_manipulator(self.get_value(obj, datasource)))
+            except Exception as e:
+                record_error(datasource, self.name, e)
+                cells.append(RowValueError(e))
+        return cells
+
+    def _get_getter(self, attr_name):
+        """
+            returns the function that reads `attr_name`, compiled once per column
+        """
+        try:
+            return self._getters[attr_name]
+        except KeyError:
+            getter = self._getters[attr_name] = attr_getter(attr_name, NOTFOUND)
+            return getter
+
+    def __getstate__(self):
+        # the getters are closures, compiled again when needed
+        state = dict(self.__dict__)
+        state['_getters'] = {}
+        return state
+
     def _get_value_from_attr(self, obj, attr_name, datasource):
         try:
-            notfound = object()
-            attr = get_attr(obj, attr_name, notfound)
-            if attr is notfound:
+            attr = self._get_getter(attr_name)(obj)
+            if attr is NOTFOUND:
                 attr = getattr(datasource, attr_name, None)
                 if attr:
                     if callable(attr):
@@ -98,7 +144,6 @@ class Column(object):
                     return attr()
                 return attr
         except Exception as e:
-            logger.exception(e)
             raise ValueError("Unable to get value from `%s`: `%s` `%s`" % (attr_name, type(e), e))
         raise ValueError(attr_name)
 
@@ -125,13 +170,83 @@ class CalcColumn(Column):
         self.attrs = attrs
         super(CalcColumn, self).__init__(attrs, **kwargs)
 
+    @property
+    def sql_alias(self):
+        """
+            name of the value when computed by the database (see `ereports.engine.planner.get_calc_sql`)
+        """
+        return 'ereports_calc_%s' % self.name
+
     def get_value(self, obj, datasource):
+        value = getattr(obj, self.sql_alias, NOTFOUND)
+        if value is not NOTFOUND:
+            return RowValue(value, self)
         result = self.initial
         for el in self.attrs:
             value = self._get_value_from_attr(obj, el, datasource)
             result = self.op(value, result)
         return RowValue(result, self)
 
+    def get_cells(self, objects, datasource):
+        """
+            reads each attribute for the whole batch, then folds `op` over the input columns:
+            with numpy if available and the inputs are numeric, element by element otherwise.
+        """
+        if get_unbound_function(type(self).get_value) is not get_unbound_function(CalcColumn.get_value) or \
+                (objects and hasattr(objects[0], self.sql_alias)):
+            return super(CalcColumn, self).get_cells(objects, datasource)
+
+        errors = {}
+        inputs = []
+        for el in self.attrs:
+            values = []
+            for i, obj in enumerate(objects):
+                try:
+                    values.append(self._get_value_from_attr(obj, el, datasource))
+                except Exception as e:
+                    errors.setdefault(i, e)
+                    values.append(None)
+            inputs.append(values)
+
+        results = None if errors else self._vectorize(inputs)
+        cells = []
+        for i in range(len(objects)):
+            try:
+                if i in errors:
+                    raise errors[i]
+                if results is not None:
+                    value = results[i]
+                else:
+                    value = self.initial
+                    for values in inputs:
+                        value = self.op(values[i], value)
+                cells.append(self.apply_manipulator(RowValue(value, self)))
+            except Exception as e:
+                record_error(datasource, self.name, e)
+                cells.append(RowValueError(e))
+        return cells
+
+    def _vectorize(self, inputs):
+        """
+            returns the list of the results computed with numpy arrays, or None if
+            numpy is not available, `op` is not elementwise or the inputs are not
+            plain int/float values.
+        """
+        if numpy is None or self.op not in VECTOR_OPS or not inputs or not inputs[0]:
+            return None
+        values = [v for column in inputs for v in column] + [self.initial]
+        if not all(isinstance(v, (integer_types, float)) and not isinstance(v, bool) for v in values):
+            return None
+        if not any(isinstance(v, float) for v in values):
+            # numpy integers do not grow
+            bound, terms = max(abs(v) for v in values) or 1, len(inputs) + 1
+            if (bound ** terms if self.op is operator.mul else bound * terms) > MAXINT:
+                return None
+        result = self.initial
+        for column in inputs:
+            result = self.op(numpy.array(column), result)
+        return result.tolist()
+
 
 class ColumnCallable(Column):
     """
@@ -157,7 +272,6 @@ class ColumnCallable(Column):
             value = self.attr(obj, datasource)
             return RowValue(value, self)
         except Exception as e:
-            logger.exception(e)
             raise ValueError("ColumnCallable: Unable to get value from `%s`: `%s`" % (self.attr, e))
 
 
@@ -223,7 +337,7 @@ class OptionalColumn(Column):
         try:
             value = self._get_value_from_attr(obj, self.attr, datasource)
         except ValueError as e:
-            logger.exception(e)
+            record_error(datasource, self.name, e)
             value = ""
         return RowValue(value, self)
 
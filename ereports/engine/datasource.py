@@ -1,32 +1,255 @@
 # -*- coding: utf-8 -*-
-from collections import OrderedDict
-import copy
+from itertools import islice
 import logging
+from multiprocessing.pool import Pool, ThreadPool
+import os
+import threading
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models, DEFAULT_DB_ALIAS
+from django.db.models import Max, Min, Q
+from django.db.models.query import QuerySet
 from django.utils.functional import curry
-from six import iteritems, string_types
-from ereports.engine.cache import DatasourceCacheManager, DummyCacheManager
-from ereports.engine.columns import Column, get_column_for_attribute, RowValueError
+from six import iteritems, string_types, get_unbound_function, integer_types
+from six.moves import map, zip
+from ereports.engine import serializer
+from ereports.engine.cache import DatasourceCacheManager, DummyCacheManager, monitor_model
+from ereports.engine.columnar import ColumnarResult
+from ereports.engine.errors import ErrorCollector, record_error
+from ereports.engine.columns import Column, RowValueError, get_column_for_attribute
+from ereports.engine.planner import QueryPlan, ValuesRecord
+from ereports.engine.spill import SpilledResult, spill_rows
 from ereports.engine.utils import get_tables_for_query
-from ereports.utils import get_model_field_names
+from ereports.utils import get_model_field_names, get_attr
 
 REPR_OUTPUT_SIZE = 20
 
 logger = logging.getLogger(__name__)
+_filter_stats_lock = threading.Lock()
 
 
 class RecordFilteredError(Exception):
     pass
 
 
-class DatasourceRow(OrderedDict):
+class BatchFilter(object):
+    """
+        custom filter applied to a chunk of rows (see `Datasource.add_custom_filter()`).
+
+        `func(rows)` returns a keep-mask (one boolean per row) or the list of the rows to keep
+
+        >>> f = BatchFilter(lambda rows: [r % 2 == 1 for r in rows])
+        >>> f([1, 2, 3])
+        [1, 3]
+        >>> f = BatchFilter(lambda rows: [r for r in rows if r > 1])
+        >>> f([1, 2, 3])
+        [2, 3]
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, rows):
+        result = list(self.func(rows))
+        if len(result) == len(rows) and all(isinstance(keep, bool) for keep in result):
+            return [row for row, keep in zip(rows, result) if keep]
+        return result
+
+
+def _get_filter_name(func):
+    """
+        returns the name used by `Datasource.filter_stats` for the custom filter `func`
+    """
+    func = getattr(func, 'func', func)
+    return getattr(func, '__name__', repr(func))
+
+
+class RowHeader(object):
+    """
+        the column names of a DatasourceRow, shared by all the rows with the same columns
+    """
+    __slots__ = ('names', 'index')
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+
+    def __getstate__(self):
+        return (self.names, )
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return "<RowHeader: %s>" % (self.names, )
+
+
+_headers = {}
+
+
+def get_row_header(names):
+    """
+        returns the RowHeader for `names`, creating it only once
+    """
+    names = tuple(names)
+    try:
+        return _headers[names]
+    except KeyError:
+        header = _headers[names] = RowHeader(names)
+        return header
+
+
+class LazyCell(object):
+    """
+        placeholder of a cell not computed by the datasource (see `Datasource.required_columns`),
+        shared by all the rows: DatasourceRow computes the value from its record when accessed.
+        The errors of the run are logged when it ends: the ones of the lazy cells are logged here.
+    """
+    __slots__ = ('column', 'datasource')
+
+    def __init__(self, column, datasource):
+        self.column = column
+        self.datasource = datasource
+
+    def evaluate(self, obj):
+        cell = self.column.get_cells([obj], self.datasource)[0]
+        if isinstance(cell, RowValueError):
+            logger.error("%s: %s %s (lazy cell)", self.datasource.__class__.__name__,
+                         self.column.name, type(cell.args[0]).__name__)
+        return cell
+
+    def __repr__(self):
+        return "<LazyCell: %s>" % self.column.name
+
+
+class DatasourceRow(object):
+    """
+        a row of data: acts as an ordered dictionary {column name: RowValue} with attribute access.
+
+        values are stored in a tuple, names are kept in a RowHeader shared by
+        all the rows with the same columns. `_original` is the source record.
+        Cells of the columns not required by the datasource are computed when accessed.
+    """
+    __slots__ = ('_header', '_values', '_original')
+    __hash__ = None
+
+    def __init__(self, items=(), header=None, values=(), original=None):
+        if header is None:
+            items = list(items)
+            header = get_row_header([name for name, __ in items])
+            values = [value for __, value in items]
+        self._header = header
+        self._values = tuple(values)
+        self._original = original
+
+    def __getitem__(self, item):
+        idx = self._header.index[item]
+        value = self._values[idx]
+        if type(value) is LazyCell:
+            value = value.evaluate(self._original)
+            self._values = self._values[:idx] + (value, ) + self._values[idx + 1:]
+        return value
+
+    def _get_values(self):
+        """
+            returns the values, computing the lazy cells
+        """
+        if any(type(v) is LazyCell for v in self._values):
+            self._values = tuple(v.evaluate(self._original) if type(v) is LazyCell else v
+                                 for v in self._values)
+        return self._values
+
+    def __setitem__(self, key, value):
+        try:
+            idx = self._header.index[key]
+            self._values = self._values[:idx] + (value, ) + self._values[idx + 1:]
+        except KeyError:
+            self._header = get_row_header(self._header.names + (key, ))
+            self._values += (value, )
+
     def __getattr__(self, item):
-        if item in self:
+        if item.startswith('_'):
+            raise AttributeError(item)
+        try:
             return self[item]
-        return OrderedDict.__getattr__(self, item)
+        except KeyError:
+            raise AttributeError(item)
+
+    def __contains__(self, item):
+        return item in self._header.index
+
+    def __iter__(self):
+        return iter(self._header.names)
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._header.names)
+
+    def values(self):
+        return list(self._get_values())
+
+    def items(self):
+        return list(zip(self._header.names, self._get_values()))
+
+    def iterkeys(self):
+        return iter(self._header.names)
+
+    def itervalues(self):
+        return iter(self._get_values())
+
+    def iteritems(self):
+        return zip(self._header.names, self._get_values())
+
+    def select(self, header):
+        """
+            returns a new row with the columns of `header`, in that order
+        """
+        return DatasourceRow(header=header, values=[self[name] for name in header.names], original=self._original)
 
     def __eq__(self, other):
-        return tuple(v.value for k, v in self.items()) == other
+        return tuple(v.value for v in self._get_values()) == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __getstate__(self):
+        return self._header, self._get_values(), self._original
+
+    def __setstate__(self, state):
+        self._header, self._values, self._original = state
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.items())
+
+
+def _process_partition(task):
+    """
+        processes a partition of `Datasource._process_partitions()` in a worker thread or process.
+
+        module level function, so that process pools can pickle it. The rows computed in
+        another process are returned serialized, with the errors and the discarded rows.
+    :return: (rows, ErrorCollector, filter_stats)
+    """
+    datasource, query, using, caller = task
+    forked = os.getpid() != caller[0]
+    qs = QuerySet(model=datasource.model, query=query, using=using)
+    if forked:
+        datasource.required_columns = None  # the rows are serialized with all their values
+    try:
+        rows = datasource._process_objects(datasource._get_records(qs))
+        if forked:
+            rows = serializer.dumps(rows, level=0)
+        return rows, datasource.errors, datasource.filter_stats
+    finally:
+        if forked or threading.current_thread().ident != caller[1]:
+            connections[using].close()
 
 
 class Datasource(object):
@@ -45,14 +268,34 @@ class Datasource(object):
     order_by = None
     use_cache = False
     dependent_models = None  # used by the cache system
+    dependent_tables = None  # tables read by the query, computed by `_get_queryset()`
     cache_manager = None
+    streaming = False  # iterate with `stream()` instead of materializing the result
+    chunk_size = 1000  # number of records processed at once by `stream()`
+    use_values = False  # fetch plain field columns with `QuerySet.values()` (see `get_query_plan()`)
+    select_related = None  # None: computed by `get_query_plan()`, True: all the not null ForeignKeys, or lookups
+    group_by = None  # (group, internal order) set by the report, used to plan the related lookups
+    columnar = False  # materialize the result in a ColumnarResult instead of a tuple of rows
+    workers = 1  # number of partitions processed in parallel by `_create_result_cache()`
+    pool_class = ThreadPool  # ThreadPool or multiprocessing Pool (see `_process_partitions()`)
+    required_columns = None  # names of the columns to compute, the others when accessed (see `_get_required_columns()`)
+    query_filters = ()  # Q objects or lookup dicts applied to the queryset
+    spill_threshold = None  # number of rows above which the result is stored in a temporary file
+    spill_dir = None  # directory of the temporary files, default `tempfile.gettempdir()`
 
     def __init__(self, **kwargs):
         self.kwfilters = {}
         self.filters = []
         self._result_cache = None
         self._queryset = None
-        self._custom_filters = kwargs.pop('custom_filters', [])
+        self._query_plan = None
+        self._row_header = None
+        self._cache_generation = None  # generation of the model read by `IncrementalCacheManager.load()`
+        self._custom_filters = []
+        self.filter_stats = {}  # {python filter: discarded rows}
+        self.errors = ErrorCollector()  # values that could not be computed by the last run
+        for func in kwargs.pop('custom_filters', []):
+            self.add_custom_filter(func)
         self.extras = kwargs.pop('extras', {})
 
         for key, value in iteritems(kwargs):
@@ -101,75 +344,470 @@ class Datasource(object):
         return cls(**initkwargs)
 
     def __repr__(self):
-        data = list(self.get_data()[:REPR_OUTPUT_SIZE + 1])
+        data = list(self[:REPR_OUTPUT_SIZE + 1])
         if len(data) > REPR_OUTPUT_SIZE:
             data[-1] = "...(remaining elements truncated)..."
         return repr(data)
 
     def __len__(self):
+        if self._get_cached_data() is None and self._can_push_down():
+            return self._get_queryset().count()
         return len(self.get_data())
 
+    def __bool__(self):
+        if self._get_cached_data() is None and self._can_push_down():
+            return self._get_queryset().exists()
+        return bool(self.get_data())
+
+    __nonzero__ = __bool__
+
+    def _get_cached_data(self):
+        """
+            returns the materialized result if available in the internal or in the external cache
+        """
+        if self._result_cache is None:
+            self._result_cache = self.cache_manager.load(self)
+        return self._result_cache
+
     def filter_record(self, obj):
+        """
+            override to discard `obj`: return False (or raise RecordFilteredError)
+        """
         pass
 
-    def add_custom_filter(self, func):
-        self._custom_filters.append(func)
+    def filter_records(self, objects):
+        """
+            returns the list of the `objects` accepted by `filter_record()`.
+            Override to filter a whole chunk at once.
+        """
+        if not self._has_record_filter():
+            return list(objects)
+        records = []
+        for obj in objects:
+            try:
+                if self.filter_record(obj) is not False:
+                    records.append(obj)
+            except RecordFilteredError:
+                pass
+            except ValueError as e:
+                record_error(self, 'filter_record', e)
+        return records
+
+    def _has_record_filter(self):
+        return getattr(self.filter_record, '__func__', None) is not get_unbound_function(Datasource.filter_record)
+
+    def _get_record_filter_name(self):
+        """
+            returns the name of the overridden record filter hook, or None
+        """
+        if getattr(self.filter_records, '__func__', None) is not get_unbound_function(Datasource.filter_records):
+            return 'filter_records'
+        if self._has_record_filter():
+            return 'filter_record'
+        return None
+
+    def _can_push_down(self):
+        """
+            returns True if the rows are fully described by the queryset, ie. there is
+            no `filter_record`/`filter_records` override and no custom filter, so counts
+            and aggregations can be computed by the database.
+        """
+        return not self._custom_filters and self._get_record_filter_name() is None
+
+    def add_custom_filter(self, func, batch=False):
+        """
+            adds a filter on the rows of the datasource.
+
+            Q objects and lookup dicts are applied to the queryset (see `add_filters()`).
+            `func(row)` discards the row returning False (or raising RecordFilteredError);
+            with `batch=True` `func(rows)` receives a chunk of rows and returns a keep-mask
+            or the list of the rows to keep (see `BatchFilter`).
+        """
+        if isinstance(func, Q):
+            self.add_filters(func)
+        elif isinstance(func, dict):
+            # as Q: a later dict with the same lookups must not replace this one
+            self.add_filters(Q(**func))
+        else:
+            self._custom_filters.append(BatchFilter(func) if batch else func)
+
+    def _reset_stats(self):
+        """
+            clears the errors and the discarded rows of the previous run
+        """
+        self.errors.clear()
+        with _filter_stats_lock:
+            self.filter_stats.clear()
+
+    def _count_discarded(self, name, count):
+        with _filter_stats_lock:
+            self.filter_stats[name] = self.filter_stats.get(name, 0) + count
+
+    def get_python_filters(self):
+        """
+            returns the names of the filters that cannot be applied by the database
+        """
+        record_filter = self._get_record_filter_name()
+        names = [record_filter] if record_filter else []
+        return names + [_get_filter_name(func) for func in self._custom_filters]
 
     def __iter__(self):
+        if self.streaming and self._result_cache is None:
+            return self.stream()
         return iter(self.get_data())
 
+    def __aiter__(self):
+        """
+            asynchronous iteration (`async for row in datasource`): rows are fetched
+            `chunk_size` at time in a worker thread (see `ereports.engine.aio`)
+        """
+        from ereports.engine.aio import AsyncIterator
+
+        return AsyncIterator(self.__iter__, self.chunk_size)
+
+    def aget_data(self):
+        """
+            asynchronous `get_data()`: `rows = await datasource.aget_data()`
+        :return: asyncio.Future
+        """
+        from ereports.engine.aio import run_in_thread
+
+        return run_in_thread(self.get_data)
+
     def __getitem__(self, k):
+        """
+            when the result is not available, slices and indexes are translated
+            in LIMIT/OFFSET queries. If python filters are configured, the records are
+            fetched and filtered a page at time until enough rows are collected.
+            Negative indexes and steps need the whole result.
+        """
+        if self._get_cached_data() is None:
+            if isinstance(k, slice):
+                start, stop = k.start or 0, k.stop
+                if start >= 0 and (stop is None or stop >= 0) and k.step is None:
+                    return tuple(self._get_slice(start, stop))
+            elif isinstance(k, integer_types) and k >= 0:
+                rows = self._get_slice(k, k + 1)
+                if not rows:
+                    raise IndexError("Datasource index out of range")
+                return rows[0]
         ds = self.get_data()
         ret = ds[k]
         return ret
 
+    def _get_slice(self, start, stop):
+        qs = self._get_queryset()
+        if not qs.ordered:
+            qs = qs.order_by('pk')
+        if self._can_push_down():
+            return self._process_objects(self._get_records(qs[start:stop]), partial=True)
+
+        page_size = self.chunk_size if stop is None else min(self.chunk_size, stop)
+        rows = []
+        offset = 0
+        while stop is None or len(rows) < stop:
+            records = list(qs[offset:offset + page_size])
+            rows.extend(self._process_objects(self._get_records(records), partial=True))
+            if len(records) < page_size:
+                break
+            offset += page_size
+        return rows[start:stop]
+
     def add_filters(self, *args, **kwargs):
         for k, v in kwargs.items():
             self.kwfilters[k] = v
         for v in args:
             self.filters.append(v)
 
-    def _create_result_cache(self):
-        result_cache = []
-        qs = self._get_queryset()
-        for obj in qs:
+    def _iter_chunks(self, objects, chunk_size):
+        iterator = iter(objects)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                break
+            yield chunk
+
+    def _process_objects(self, objects, partial=False):
+        """
+            applies `filter_records` to the objects, the columns to the accepted ones
+            and the custom filters to the resulting rows
+        :param objects: iterable of model instances
+        :param partial: True if the objects are not part of a full run (ie. slices):
+            the discarded rows are not counted in `filter_stats`
+        :return: list of DatasourceRow
+        """
+        objects = list(objects)
+        records = self.filter_records(objects)
+        record_filter = self._get_record_filter_name()
+        if record_filter and not partial:
+            self._count_discarded(record_filter, len(objects) - len(records))
+
+        # columns are evaluated on the whole batch (see `Column.get_cells()`)
+        header = self._get_row_header()
+        required = self._get_required_columns()
+        cells = [col.get_cells(records, self) if required is None or col.name in required
+                 else [LazyCell(col, self)] * len(records)
+                 for col in self.columns]
+        rows = [self.RowClass(header=header, values=[column[i] for column in cells], original=obj)
+                for i, obj in enumerate(records)]
+        for func in self._custom_filters:
+            if not rows:
+                break
+            count = len(rows)
+            if isinstance(func, BatchFilter):
+                rows = func(rows)
+            else:
+                rows = self._apply_filter(func, rows)
+            if not partial:
+                self._count_discarded(_get_filter_name(func), count - len(rows))
+        return rows
+
+    def _get_required_columns(self):
+        """
+            returns `required_columns`, or None (all the columns) if the values of the result are
+            stored (in the cache, in a ColumnarResult or in a spilled file): the stored rows have no
+            record to compute a lazy cell, and the errors are counted (and logged) by the run.
+        """
+        if self.use_cache or self.columnar or self.spill_threshold is not None:
+            return None
+        return self.required_columns
+
+    def _apply_filter(self, func, rows):
+        kept = []
+        for row in rows:
             try:
-                self.filter_record(obj)
-                row = self._get_values_from_object(obj)
-                for func in self._custom_filters:
-                    func(row)
-                result_cache.append(row)
+                if func(row) is not False:
+                    kept.append(row)
             except RecordFilteredError:
                 pass
             except ValueError as e:
-                logger.exception(e)
-        return tuple(result_cache)
+                record_error(self, _get_filter_name(func), e)
+        return kept
+
+    def _get_records(self, objects):
+        if self._use_projection():
+            return map(self.get_query_plan().record, objects)
+        return objects
+
+    def _create_result_cache(self):
+        if self.workers > 1:
+            rows = self._process_partitions(self._get_partitions(self._get_queryset()))
+        elif self.columnar or self.spill_threshold is not None:
+            # records are not kept in memory, only the column values or the spilled rows
+            chunks = self._iter_chunks(self._get_records(self._get_queryset().iterator()), self.chunk_size)
+            rows = (row for chunk in chunks for row in self._process_objects(chunk))
+        else:
+            rows = self._process_objects(self._get_records(self._get_queryset()))
+
+        result = self._materialize(rows)
+        if self.filter_stats:
+            logger.debug("%s: rows discarded by python filters %s", self.__class__.__name__, self.filter_stats)
+        return result
+
+    def _materialize(self, rows):
+        """
+            returns the result built from `rows`: a ColumnarResult, a SpilledResult
+            if there are more than `spill_threshold` rows, or a tuple
+        """
+        if self.columnar:
+            return ColumnarResult.from_rows(self._get_row_header(), rows, self.RowClass, self.columns)
+        elif self.spill_threshold is not None:
+            return spill_rows(self._get_row_header(), rows, self.RowClass, self.columns,
+                              self.spill_threshold, self.spill_dir)
+        return tuple(rows)
+
+    def _get_partitions(self, qs):
+        """
+            splits `qs` in up to `workers` querysets whose results, concatenated, are the result of `qs`.
+
+            unordered (or ordered by primary key) querysets are split in primary key ranges,
+            the others in LIMIT/OFFSET slices of the result ordered by the primary key too,
+            otherwise rows with the same values could be read by two slices and missed.
+            A sliced queryset cannot be filtered nor reordered: it is split in slices only
+            if it is ordered by primary key, otherwise it is a single partition.
+        :return: list of QuerySet
+        """
+        ordering = list(qs.query.extra_order_by or qs.query.order_by)
+        if not ordering and qs.query.default_ordering:
+            ordering = list(self.model._meta.ordering)
+        pk = self.model._meta.pk
+        sliced = not qs.query.can_filter()
+
+        if (not sliced and ordering in ([], ['pk'], [pk.name]) and
+                isinstance(pk, (models.AutoField, models.IntegerField))):
+            bounds = qs.aggregate(ereports_min=Min('pk'), ereports_max=Max('pk'))
+            if bounds['ereports_min'] is None:
+                return []
+            step = (bounds['ereports_max'] - bounds['ereports_min']) // self.workers + 1
+            return [qs.filter(pk__gte=start, pk__lt=start + step).order_by('pk')
+                    for start in range(bounds['ereports_min'], bounds['ereports_max'] + 1, step)]
+
+        if not any(lookup.lstrip('-') in ('pk', pk.name) for lookup in ordering):
+            if sliced:
+                return [qs]
+            qs = qs.order_by(*ordering + ['pk'])
+        count = qs.count()
+        size = -(-count // self.workers)  # ceil
+        return [qs[start:start + size] for start in range(0, count, size)]
+
+    def _process_partitions(self, partitions):
+        """
+            processes each partition in a worker of `pool_class` and merges the results.
+
+            a ThreadPool shares the datasource with the workers, but the columns are python
+            code that holds the GIL: only the time spent waiting for the database is overlapped.
+            A process pool (`multiprocessing.pool.Pool`) computes the columns in parallel too:
+            the datasource is pickled with each partition, so its columns and custom filters
+            must be picklable (ie. module level functions), and the database connections of
+            the calling process are closed before the workers are forked (not in a transaction).
+            Each worker uses (and closes) its own database connection.
+        :return: list of DatasourceRow
+        """
+        if len(partitions) < 2:
+            return [row for qs in partitions for row in self._process_objects(self._get_records(qs))]
+        pool_class = self.pool_class
+        if isinstance(pool_class, type) and issubclass(pool_class, Pool) and not issubclass(pool_class, ThreadPool):
+            self.get_query_plan()  # the queryset is not pickled
+            for conn in connections.all():
+                conn.close()
+        caller = (os.getpid(), threading.current_thread().ident)
+        tasks = [(self, qs.query, qs.db, caller) for qs in partitions]
+
+        pool = pool_class(min(self.workers, len(partitions)))
+        try:
+            results = pool.map(_process_partition, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+        rows = []
+        for values, errors, filter_stats in results:
+            if errors is not self.errors:
+                # processed by a copy of the datasource in another process
+                values = serializer.loads(values, self)
+                self.errors.update(errors)
+                for name, count in filter_stats.items():
+                    self._count_discarded(name, count)
+            rows.extend(values)
+        return rows
+
+    def stream(self, chunk_size=None):
+        """
+            iterates the datasource rows without materializing the whole result.
+
+            records are fetched with `QuerySet.iterator()` and processed `chunk_size`
+            at time, so memory usage does not depend on the number of rows.
+            Already available results (internal or external cache) are used if present.
+
+        :param chunk_size: number of records to process at once, defaults to `Datasource.chunk_size`
+        :return: generator of DatasourceRow
+        """
+        data = self._get_cached_data()
+        if data is not None:
+            for row in data:
+                yield row
+            return
+
+        qs = self._get_queryset()
+        self._reset_stats()
+        for chunk in self._iter_chunks(self._get_records(qs.iterator()), chunk_size or self.chunk_size):
+            for row in self._process_objects(chunk):
+                yield row
+        self.errors.log(logger, '%s: ' % self.__class__.__name__)
 
     def get_data(self):
         if self._result_cache is None:
-            cache_key = self.cache_manager.get_key(self)
-            cached_data = self.cache_manager.retrieve(cache_key)
+            cached_data = self.cache_manager.load(self)
             if cached_data is None:
+                self._reset_stats()
                 self._result_cache = self._create_result_cache()
-                self.cache_manager.store(cache_key, self._result_cache)
+                self.errors.log(logger, '%s: ' % self.__class__.__name__)
+                if not isinstance(self._result_cache, SpilledResult):
+                    self.cache_manager.save(self, self._result_cache)
             else:
                 self._result_cache = cached_data
         return self._result_cache
 
+    def patch_result(self, rows, pks):
+        """
+            returns `rows` updated with the current state of the records with primary key in `pks`:
+            the records are evaluated again, the ones that do not match the filters anymore are removed.
+            returns None if `rows` cannot be patched (ie. rows without the source record).
+        :param rows: tuple of DatasourceRow
+        :param pks: set of primary keys
+        :return: tuple of DatasourceRow or None
+        """
+        if not isinstance(rows, tuple) or any(row._original is None for row in rows):
+            return None
+        qs = self._get_queryset()
+        changed = self._process_objects(self._get_records(qs.filter(pk__in=pks)), partial=True)
+        fresh = dict((row._original.pk, row) for row in changed)
+        result = [fresh.pop(row._original.pk, row) for row in rows
+                  if row._original.pk not in pks or row._original.pk in fresh]
+        result.extend(row for row in changed if row._original.pk in fresh)
+
+        ordering = list(qs.query.extra_order_by or qs.query.order_by)
+        if not ordering and qs.query.default_ordering:
+            ordering = list(self.model._meta.ordering)
+        if '?' not in ordering:
+            # stable sorts, from the last lookup
+            for lookup in reversed(ordering):
+                path = lookup.lstrip('-').replace('__', '.')
+                result.sort(key=lambda row: get_attr(row._original, path), reverse=lookup.startswith('-'))
+        return tuple(result)
+
+    def get_dependent_tables(self):
+        """
+            returns the names of the tables read by the query (joins and subqueries)
+            and by the columns (related models), used by the cache system
+        """
+        self._get_queryset()
+        return sorted(set(self.dependent_tables) | self.get_query_plan().tables)
+
     def _get_queryset(self):
-        if not bool(self._queryset):
+        if self._queryset is None:
             if self.queryset:
                 qs = self.queryset
             else:
                 qs = self.model._default_manager.all()
             qs = qs.filter(*self.filters, **self.kwfilters)
+            for lookup in self.query_filters:
+                qs = qs.filter(**lookup) if isinstance(lookup, dict) else qs.filter(lookup)
+            plan = self.get_query_plan()
+            if plan.extra_select:
+                qs = qs.extra(select=plan.extra_select)
             if self.order_by is not None:
-                qs = qs.order_by(*self.order_by)
-            qs = qs.select_related()
+                qs = qs.order_by(*plan.get_order_by(self.order_by))
+            if self._use_projection():
+                qs = qs.values(*plan.lookups)
+            else:
+                if self.select_related is True:
+                    qs = qs.select_related()
+                elif self.select_related:
+                    qs = qs.select_related(*self.select_related)
+                elif plan.select_related:
+                    qs = qs.select_related(*plan.select_related)
+                if plan.prefetch_related:
+                    qs = qs.prefetch_related(*plan.prefetch_related)
             self._queryset = qs
             self.dependent_tables = get_tables_for_query(qs.query)
         return self._queryset
 
+    def get_query_plan(self):
+        """
+            returns the QueryPlan computed from the datasource columns, `group_by` and `order_by`
+        :return: QueryPlan
+        """
+        if self._query_plan is None:
+            paths = [lookup.lstrip('-').replace('__', '.') for lookup in self.order_by or []]
+            paths.extend(attr for attr in self.group_by or [] if isinstance(attr, string_types))
+            using = self.queryset.db if self.queryset is not None else None
+            self._query_plan = QueryPlan(self.model, self.columns, paths, using=using)
+        return self._query_plan
+
+    def _use_projection(self):
+        return self.use_values and self.get_query_plan().projectable
+
     def query(self):
         self.get_data()
         return self._queryset.query
@@ -180,27 +818,157 @@ class Datasource(object):
         :param obj:
         :return:
         """
-        row = self.RowClass()
-        for col in self.columns:
-            try:
-                cell = col.get_value(obj, self)
-                row[col.name] = col.apply_manipulator(cell)
-                row._original = obj
-                # values.append(col.apply_manipulator(cell))
-            except Exception as e:
-                row[col.name] = RowValueError(e)
-                # values.append(RowValueError(e))
+        values = [col.get_cells([obj], self)[0] for col in self.columns]
+        return self.RowClass(header=self._get_row_header(), values=values, original=obj)
+
+    def _get_row_header(self):
+        if self._row_header is None:
+            self._row_header = get_row_header([c.name for c in self.columns])
+        return self._row_header
 
-        # row = self.RowClass(values)
-        return row
+    def __getstate__(self):
+        # querysets are evaluated when pickled: the workers of a process pool receive the query
+        state = dict(self.__dict__)
+        state.update(queryset=None, _queryset=None, _result_cache=None)
+        return state
 
     def _clone(self, extras=None):
+        """
+            returns a copy of the datasource that can be filtered independently.
+
+            columns and configuration are shared, the filters are copied and the
+            result, the queryset and the query plan are computed again by the copy.
+        """
         klass = self.__class__
-        kwargs = copy.deepcopy(self.__dict__)
-        if extras is not None:
-            kwargs["extras"] = extras
+        kwargs = dict(self.__dict__)
+        kwargs.update(kwfilters=dict(self.kwfilters),
+                      filters=list(self.filters),
+                      _custom_filters=list(self._custom_filters),
+                      extras=dict(self.extras) if extras is None else extras,
+                      filter_stats={},
+                      errors=ErrorCollector(),
+                      _result_cache=None,
+                      _queryset=None,
+                      _query_plan=None,
+                      _row_header=None,
+                      _cache_generation=None)
+        if 'columns' in kwargs:
+            kwargs['columns'] = list(self.columns)
         if self.queryset:
             kwargs.update({'queryset': self.queryset._clone()})
-        c = klass()
+        c = klass.__new__(klass)
         c.__dict__.update(kwargs)
         return c
+
+
+class RawSQLDatasource(Datasource):
+    """
+        Datasource of the rows returned by a raw SQL query (ie. window functions, CTE).
+
+        rows are read with `cursor.fetchmany()`, `chunk_size` at time, and exposed to
+        the columns as records with an attribute for each column of the result.
+        Columns must be declared: names (read as `Column`), `(name, ColumnClass)` or Column instances.
+
+        ORM features (filters, `order_by`, `use_values`, `workers`, database totals) are not available.
+        The cached results are invalidated by the changes of the models
+        of the `dependent_tables` (and of the `dependent_models`).
+
+    :param sql: SQL statement, with `%s` placeholders
+    :param params: parameters of `sql`
+    """
+    sql = None
+    params = ()
+    using = DEFAULT_DB_ALIAS
+    dependent_tables = None  # tables read by `sql`, used by the cache system
+    pk_column = 'id'  # name of the column to read as `record.pk`
+
+    @classmethod
+    def as_datasource(cls, **initkwargs):
+        for key, value in initkwargs.items():
+            if not hasattr(cls, key) and not callable(value):
+                raise TypeError(u"%s() received an invalid keyword %r" % (cls.__name__, key))
+
+        _columns = initkwargs.get('columns', cls.columns)
+        if not initkwargs.get('sql', cls.sql) or not _columns:
+            raise ImproperlyConfigured(u"%(cls)s is missing the sql or the columns. Define "
+                                       u"%(cls)s.sql, %(cls)s.columns" % {'cls': cls.__name__})
+        columns = []
+        for col in _columns:
+            if isinstance(col, string_types):
+                col = Column(col)
+            elif isinstance(col, (list, tuple)):
+                name, Class = col
+                col = Class(name)
+            columns.append(col)
+        initkwargs['columns'] = columns
+        initkwargs['RowClass'] = DatasourceRow
+
+        dependent_models = list(initkwargs.get('dependent_models', cls.dependent_models) or [])
+        tables = initkwargs.get('dependent_tables', cls.dependent_tables) or []
+        dependent_models.extend(m for m in models.get_models()
+                                if m._meta.db_table in tables and m not in dependent_models)
+        initkwargs['dependent_models'] = dependent_models
+        if initkwargs.get('use_cache', cls.use_cache):
+            for model in dependent_models:
+                monitor_model(model)
+
+        return cls(**initkwargs)
+
+    def _can_push_down(self):
+        return False
+
+    def add_filters(self, *args, **kwargs):
+        if args or kwargs:
+            raise ImproperlyConfigured(u"%s cannot filter the rows of a raw SQL query: "
+                                       u"add the conditions to the sql" % self.__class__.__name__)
+
+    def get_dependent_tables(self):
+        return self.dependent_tables
+
+    def _get_queryset(self):
+        raise ImproperlyConfigured(u"%s has no queryset" % self.__class__.__name__)
+
+    def get_query_plan(self):
+        raise ImproperlyConfigured(u"%s has no queryset" % self.__class__.__name__)
+
+    def query(self):
+        return self.sql
+
+    def _get_cursor_records(self, chunk_size):
+        """
+            executes `sql` and yields the records, fetching `chunk_size` rows at time
+        """
+        cursor = connections[self.using].cursor()
+        try:
+            cursor.execute(self.sql, self.params)
+            names = [d[0] for d in cursor.description]
+            relations = frozenset()
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for values in rows:
+                    yield ValuesRecord(dict(zip(names, values)), relations, self.pk_column)
+        finally:
+            cursor.close()
+
+    def _iter_rows(self, chunk_size, partial=False):
+        for chunk in self._iter_chunks(self._get_cursor_records(chunk_size), chunk_size):
+            for row in self._process_objects(chunk, partial):
+                yield row
+
+    def _get_slice(self, start, stop):
+        return list(islice(self._iter_rows(self.chunk_size, partial=True), start, stop))
+
+    def _create_result_cache(self):
+        return self._materialize(self._iter_rows(self.chunk_size))
+
+    def stream(self, chunk_size=None):
+        data = self._get_cached_data()
+        if data is not None:
+            return iter(data)
+        self._reset_stats()
+        return self._iter_rows(chunk_size or self.chunk_size)
+
+    def patch_result(self, rows, pks):
+        return None
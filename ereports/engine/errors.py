@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import threading
+import traceback
+
+_lock = threading.Lock()
+
+
+def record_error(datasource, name, error):
+    """
+        records `error` raised computing `name` (a column or a filter) in the
+        ErrorCollector of `datasource`, if any. Must be called in the `except` clause.
+    """
+    errors = getattr(datasource, 'errors', None)
+    if errors is not None:
+        errors.add(name, error)
+
+
+class ErrorCollector(object):
+    """
+        counts the values that could not be computed by a datasource, by column (or filter)
+        and exception type, and keeps the traceback of the first `max_samples` errors.
+
+        >>> errors = ErrorCollector()
+        >>> for i in range(3):
+        ...     try:
+        ...         {}['a']
+        ...     except KeyError as e:
+        ...         errors.add('price', e)
+        >>> errors.total, errors.items()
+        (3, [('price', 'KeyError', 3)])
+        >>> errors.summary()
+        '3 errors: price KeyError x3'
+    """
+    max_samples = 5
+
+    def __init__(self, max_samples=None):
+        if max_samples is not None:
+            self.max_samples = max_samples
+        self.counts = {}  # {(name, exception type): count}
+        self.samples = []  # [(name, formatted traceback)]
+
+    def add(self, name, error):
+        key = (name, type(error).__name__)
+        with _lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if len(self.samples) < self.max_samples:
+                self.samples.append((name, traceback.format_exc()))
+
+    def update(self, other):
+        """
+            adds the errors collected by `other` (ie. by a worker process)
+        """
+        with _lock:
+            for key, count in other.counts.items():
+                self.counts[key] = self.counts.get(key, 0) + count
+            self.samples.extend(other.samples[:max(self.max_samples - len(self.samples), 0)])
+
+    def clear(self):
+        with _lock:
+            self.counts = {}
+            self.samples = []
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def items(self):
+        """
+            returns the list of (name, exception type, count) sorted by name
+        """
+        return sorted((name, error, count) for (name, error), count in self.counts.items())
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __bool__(self):
+        return bool(self.counts)
+
+    __nonzero__ = __bool__
+
+    def summary(self):
+        return "%d errors: %s" % (self.total, ", ".join("%s %s x%d" % item for item in self.items()))
+
+    def log(self, logger, prefix=''):
+        """
+            writes the summary and the traceback samples with a single `logger.error()` call
+        """
+        if self.counts:
+            samples = "\n".join("%s: %s" % sample for sample in self.samples)
+            logger.error("%s%s\n%s", prefix, self.summary(), samples)
+
+
+class ErrorsView(object):
+    """
+        the errors of an ErrorCollector except the ones of the columns in `exclude`
+        (ie. the missing values of an OptionalColumn, expected by design).
+        Computed when read, so it includes the errors counted while the rows are rendered.
+
+        >>> errors = ErrorCollector()
+        >>> for name in ('price', 'notes', 'notes'):
+        ...     try:
+        ...         {}['a']
+        ...     except KeyError as e:
+        ...         errors.add(name, e)
+        >>> view = ErrorsView(errors, ['notes'])
+        >>> view.total, view.items()
+        (1, [('price', 'KeyError', 1)])
+    """
+
+    def __init__(self, errors, exclude=()):
+        self.errors = errors
+        self.exclude = frozenset(exclude)
+
+    @property
+    def total(self):
+        return sum(count for __, __, count in self.items())
+
+    def items(self):
+        return [item for item in self.errors.items() if item[0] not in self.exclude]
+
+    def __len__(self):
+        return len(self.items())
+
+    def __bool__(self):
+        return bool(self.items())
+
+    __nonzero__ = __bool__
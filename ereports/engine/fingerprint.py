@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+    canonical identity of the datasources and of the report runs, used as cache key.
+
+    `canonical()` translates lookups, Q trees, columns, callables and models in
+    nested lists of strings that do not depend on dict ordering or on reprs, so
+    equivalent queries have the same fingerprint and different ones do not collide.
+    Values without a stable identity raise FingerprintError: they cannot be cached.
+"""
+import datetime
+from decimal import Decimal
+from functools import partial
+import hashlib
+from inspect import isclass
+import json
+import types
+from django.db import models
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.encoding import force_text
+from six import text_type, string_types, integer_types
+from ereports.engine.columns import Column
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:  # django < 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+
+class FingerprintError(Exception):
+    pass
+
+
+def _get_callable_name(func):
+    """
+        >>> _get_callable_name(_get_callable_name)
+        'ereports.engine.fingerprint._get_callable_name'
+    """
+    func = getattr(func, '__func__', func)
+    module = getattr(func, '__module__', None) or getattr(getattr(func, '__objclass__', None), '__name__', None)
+    name = "%s.%s" % (module, getattr(func, '__name__', type(func).__name__))
+    code = getattr(func, '__code__', None)
+    if code is not None and func.__name__ == '<lambda>':
+        name = "%s:%s" % (name, code.co_firstlineno)
+    return name
+
+
+def _sort_key(value):
+    return json.dumps(value)
+
+
+def canonical(value, ordered=True):
+    """
+        returns the canonical form of `value`. Items of unordered sequences
+        (`ordered=False`), sets and dicts are sorted.
+        Raises FingerprintError if `value` has no stable identity (ie. callable instances,
+        methods bound to instances).
+
+        >>> canonical({'b': 1, 'a': u'x'}) == canonical({'a': 'x', 'b': 1})
+        True
+        >>> canonical(Q(a=1) & Q(b=2)) == canonical(Q(b=2) & Q(a=1))
+        True
+        >>> canonical(Q(a=1) | Q(b=2)) == canonical(Q(a=1) & Q(b=2))
+        False
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    elif isinstance(value, string_types):
+        return force_text(value)
+    elif isinstance(value, integer_types):
+        return ['int', text_type(value)]
+    elif isinstance(value, (float, Decimal)):
+        return [type(value).__name__, text_type(value)]
+    elif isinstance(value, (datetime.date, datetime.time)):
+        return [type(value).__name__, value.isoformat()]
+    elif isinstance(value, dict):
+        return ['dict'] + sorted(([canonical(k), canonical(v)] for k, v in value.items()), key=_sort_key)
+    elif isinstance(value, (set, frozenset)):
+        return ['set'] + sorted((canonical(v) for v in value), key=_sort_key)
+    elif isinstance(value, (list, tuple)):
+        items = [canonical(v) for v in value]
+        return ['list'] + (items if ordered else sorted(items, key=_sort_key))
+    elif isinstance(value, Q):
+        # the children of a node are combined with the same connector
+        children = sorted((canonical(c) if isinstance(c, Q) else [force_text(c[0]), canonical(c[1])]
+                           for c in value.children), key=_sort_key)
+        return ['Q', value.connector, value.negated] + children
+    elif isinstance(value, Column):
+        return ['column', _get_callable_name(type(value)), value.name, canonical(value.attr),
+                canonical(value.format), canonical(value._manipulator),
+                canonical(getattr(value, 'op', None)), canonical(getattr(value, 'initial', None))]
+    elif isinstance(value, models.Model):
+        return ['instance', _get_callable_name(type(value)), canonical(value.pk)]
+    elif isinstance(value, QuerySet):
+        try:
+            sql = text_type(value.query)
+        except EmptyResultSet:
+            sql = None
+        return ['queryset', _get_callable_name(value.model), sql]
+    elif isclass(value):
+        return ['class', _get_callable_name(value)]
+    elif isinstance(value, types.FunctionType):
+        # functions created by the same factory differ by their defaults and closure
+        try:
+            cells = [cell.cell_contents for cell in value.__closure__ or ()]
+        except ValueError:  # empty cell
+            raise FingerprintError("incomplete closure %r" % value)
+        return ['function', _get_callable_name(value), canonical(value.__defaults__), canonical(cells)]
+    elif isinstance(value, partial):
+        return ['partial', canonical(value.func), canonical(value.args), canonical(value.keywords or {})]
+    elif isinstance(value, (types.MethodType, types.BuiltinFunctionType)):
+        owner = value.__self__
+        if owner is None or isclass(owner) or isinstance(owner, types.ModuleType):
+            return ['callable', _get_callable_name(value)]
+        # depends on the state of the instance
+        raise FingerprintError("bound method %r" % value)
+    elif type(value).__name__ in ('method_descriptor', 'wrapper_descriptor'):
+        return ['callable', _get_callable_name(value)]
+    raise FingerprintError("no canonical form for %s" % type(value))
+
+
+def get_fingerprint(*values):
+    """
+        returns the md5 hexdigest of the canonical form of `values`,
+        raises FingerprintError if a value has no canonical form
+
+        >>> get_fingerprint({'a': 1, 'b': 2}) == get_fingerprint({'b': 2, 'a': 1})
+        True
+    """
+    try:
+        data = json.dumps(canonical(values), separators=(',', ':'))
+    except RuntimeError:  # recursive closures
+        raise FingerprintError("recursive value")
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+
+def get_datasource_fingerprint(datasource):
+    """
+        returns the fingerprint of the rows of `datasource`: source (model, queryset
+        or sql), columns, filters, ordering and extras
+    """
+    return get_fingerprint(type(datasource),
+                           datasource.model,
+                           getattr(datasource, 'queryset', None),
+                           getattr(datasource, 'sql', None),
+                           getattr(datasource, 'params', None),
+                           datasource.columns,
+                           datasource.kwfilters,
+                           canonical(datasource.filters, ordered=False),
+                           canonical(datasource.query_filters, ordered=False),
+                           [getattr(f, 'func', f) for f in datasource._custom_filters],  # BatchFilter
+                           datasource.order_by,
+                           datasource.extras,
+                           datasource.columnar)
+
+
+def get_report_fingerprint(report, attributes=None):
+    """
+        returns the fingerprint of a report run: the datasource, the report class,
+        the displayed columns and the `attributes` set by the user (ie. order_by, group_by)
+    """
+    return get_fingerprint(get_datasource_fingerprint(report.datasource),
+                           type(report),
+                           report.list_display,
+                           attributes or {})
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+import operator
+from django.db import models, connections, router
+from django.db.models.fields import FieldDoesNotExist
+from six import get_unbound_function, string_types, integer_types
+from ereports.engine.columns import Column, CalcColumn, DecimalColumn, OptionalColumn, identity
+
+# `get_value()` implementations that only read `Column.attr` from the record
+ATTR_GETTERS = [get_unbound_function(c.get_value) for c in (Column, DecimalColumn, OptionalColumn)]
+
+NUMERIC_FIELDS = (models.IntegerField, models.DecimalField, models.FloatField)
+
+# `CalcColumn.op` that can be computed by the database
+SQL_OPERATORS = {operator.add: '+', operator.sub: '-', operator.mul: '*'}
+# decimal arithmetic is not portable (ie. sqlite returns floats)
+SQL_CALC_FIELDS = (models.IntegerField, models.FloatField)
+
+
+def reads_attr(column):
+    """
+        returns True if the value of `column` is only read from `column.attr`
+    """
+    return isinstance(column.attr, string_types) and \
+        get_unbound_function(type(column).get_value) in ATTR_GETTERS
+
+
+def resolve_field_path(model, path):
+    """
+        returns the list of the fields traversed by the dotted `path` or None
+        if `path` is not a chain of ForeignKeys ending with a concrete field.
+
+        >>> from django.contrib.auth.models import Permission
+        >>> [f.name for f in resolve_field_path(Permission, 'content_type.app_label')]
+        ['content_type', 'app_label']
+        >>> resolve_field_path(Permission, 'content_type.wrong')
+
+    """
+    fields = []
+    for name in path.split('.'):
+        if model is None:
+            return None
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        fields.append(field)
+        if isinstance(field, models.ForeignKey):
+            model = field.rel.to
+        elif isinstance(field, models.ManyToManyField):
+            return None
+        else:
+            model = None
+    if isinstance(fields[-1], models.ForeignKey):
+        return None
+    return fields
+
+
+def get_column_lookup(model, column):
+    """
+        returns the ORM lookup of the field read by `column` or None if the column
+        does not read a concrete field or changes its value with a manipulator.
+
+        >>> from django.contrib.auth.models import Permission
+        >>> get_column_lookup(Permission, Column('content_type.app_label'))
+        'content_type__app_label'
+        >>> get_column_lookup(Permission, Column('name', manipulator=lambda v: v.upper()))
+
+    """
+    if not reads_attr(column) or column._manipulator is not identity:
+        return None
+    fields = resolve_field_path(model, column.attr)
+    if fields:
+        return "__".join(f.name for f in fields)
+
+
+def get_sum_lookup(model, column):
+    """
+        returns the ORM lookup to use with `Sum()` to total `column` or None if
+        the column is not read from a numeric field.
+    """
+    lookup = get_column_lookup(model, column)
+    if lookup and isinstance(resolve_field_path(model, column.attr)[-1], NUMERIC_FIELDS):
+        return lookup
+
+
+def get_calc_fields(model, column):
+    """
+        returns the fields combined by the CalcColumn `column` if its result can be
+        computed by the database: `op` is +, - or *, there is no manipulator and
+        the `attrs` are not null integer or float fields stored in the table of `model`
+        (not inherited from a multi-table parent). Otherwise None.
+
+        >>> from ereports.tests.app.models import SimpleDemoModel
+        >>> [f.name for f in get_calc_fields(SimpleDemoModel, CalcColumn(['integer1', 'integer1']))]
+        ['integer1', 'integer1']
+        >>> get_calc_fields(SimpleDemoModel, CalcColumn(['integer1', 'integer2']))
+
+    """
+    if not isinstance(column, CalcColumn) or column._manipulator is not identity or \
+            get_unbound_function(type(column).get_value) is not get_unbound_function(CalcColumn.get_value):
+        return None
+    if column.op not in SQL_OPERATORS or isinstance(column.initial, bool) or \
+            not isinstance(column.initial, integer_types + (float, )) or \
+            not isinstance(column.attrs, (list, tuple)) or not column.attrs:
+        return None
+    fields = []
+    for attr in column.attrs:
+        path = isinstance(attr, string_types) and resolve_field_path(model, attr)
+        if not path or len(path) > 1 or path[0].null or not isinstance(path[0], SQL_CALC_FIELDS) or \
+                path[0].model._meta.db_table != model._meta.db_table:
+            return None
+        fields.append(path[0])
+    return fields
+
+
+def get_calc_sql(model, column, connection):
+    """
+        returns the SQL expression that computes the CalcColumn `column`, or None
+        (see `get_calc_fields()`). The expression folds `op` as `CalcColumn.get_value()`.
+    """
+    fields = get_calc_fields(model, column)
+    if not fields:
+        return None
+    qn = connection.ops.quote_name
+    sql = str(column.initial)
+    for field in fields:
+        sql = "(%s.%s %s %s)" % (qn(model._meta.db_table), qn(field.column), SQL_OPERATORS[column.op], sql)
+    return sql
+
+
+def get_relation(model, name):
+    """
+        returns a tuple (field, related model, many) for the relation `name` of `model`,
+        following the forward relations by field name and the reverse ones by accessor name.
+        returns None if `name` is not a relation.
+
+        >>> from django.contrib.auth.models import Permission, Group
+        >>> get_relation(Permission, 'content_type')[1:]
+        (<class 'django.contrib.contenttypes.models.ContentType'>, False)
+        >>> get_relation(Permission, 'group_set')[1:]
+        (<class 'django.contrib.auth.models.Group'>, True)
+        >>> get_relation(Permission, 'name')
+
+    """
+    opts = model._meta
+    try:
+        field, __, direct, m2m = opts.get_field_by_name(name)
+        if direct and m2m:
+            return field, field.rel.to, True
+        elif direct and isinstance(field, models.ForeignKey):
+            return field, field.rel.to, False
+        elif direct:
+            return None
+    except FieldDoesNotExist:
+        pass
+    for related in opts.get_all_related_objects():
+        if related.get_accessor_name() == name:
+            return related.field, related.model, not isinstance(related.field, models.OneToOneField)
+    for related in opts.get_all_related_many_to_many_objects():
+        if related.get_accessor_name() == name:
+            return related.field, related.model, True
+    return None
+
+
+def get_related_lookups(model, path):
+    """
+        returns a tuple (select_related, prefetch_related) with the lookups
+        needed to read the dotted `path` from `model` instances without extra queries.
+
+        >>> from django.contrib.auth.models import Permission
+        >>> get_related_lookups(Permission, 'content_type.app_label')
+        ('content_type', None)
+        >>> get_related_lookups(Permission, 'content_type.model_class')
+        ('content_type', None)
+        >>> get_related_lookups(Permission, 'group_set')
+        (None, 'group_set')
+        >>> get_related_lookups(Permission, 'name')
+        (None, None)
+    """
+    select, prefetch = None, None
+    names = []
+    for name in path.split('.'):
+        relation = get_relation(model, name)
+        if relation is None:
+            break
+        __, model, many = relation
+        names.append(name)
+        if many:
+            prefetch = "__".join(names)
+            break
+        select = "__".join(names)
+    return select, prefetch
+
+
+def get_default_related(model, depth=5, prefix=''):
+    """
+        returns the lookups followed by a blanket `select_related()`:
+        the not null foreign keys, up to `depth` levels.
+
+        >>> from django.contrib.auth.models import Permission
+        >>> get_default_related(Permission)
+        ['content_type']
+    """
+    lookups = []
+    if depth:
+        for field in model._meta.fields:
+            if isinstance(field, models.ForeignKey) and not field.null:
+                lookup = prefix + field.name
+                lookups.append(lookup)
+                lookups.extend(get_default_related(field.rel.to, depth - 1, lookup + '__'))
+    return lookups
+
+
+def get_related_tables(model, path):
+    """
+        returns the tables of the models read following the relations of the dotted
+        `path` from `model` instances, the intermediate tables of many-to-many included.
+
+        >>> from django.contrib.auth.models import Permission
+        >>> print(" ".join(get_related_tables(Permission, 'content_type.app_label')))
+        django_content_type
+        >>> print(" ".join(get_related_tables(Permission, 'group_set.name')))
+        auth_group_permissions auth_group
+    """
+    tables = []
+    for name in path.split('.'):
+        relation = get_relation(model, name)
+        if relation is None:
+            break
+        field, model, __ = relation
+        if isinstance(field, models.ManyToManyField):
+            tables.append(field.rel.through._meta.db_table)
+        tables.append(model._meta.db_table)
+    return tables
+
+
+def get_column_paths(column):
+    """
+        returns the dotted attributes read by `column`
+    """
+    attrs = getattr(column, 'attrs', column.attr)
+    if not isinstance(attrs, (list, tuple)):
+        attrs = [attrs]
+    return [a for a in attrs if isinstance(a, string_types)]
+
+
+class ValuesRecord(object):
+    """
+        wraps a `QuerySet.values()` dictionary and exposes it as attributes,
+        following the relations with the same dotted notation used by the columns.
+    """
+    __slots__ = ('_values', '_prefix', '_relations', '_pk')
+
+    def __init__(self, values, relations, pk, prefix=''):
+        self._values = values
+        self._relations = relations
+        self._pk = pk
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name == 'pk' and not self._prefix:
+            name = self._pk
+        key = self._prefix + name
+        try:
+            value = self._values[key]
+        except KeyError:
+            raise AttributeError(name)
+        if value is not None and key in self._relations:
+            return ValuesRecord(self._values, self._relations, self._pk, key + '__')
+        return value
+
+    def __getstate__(self):
+        return self._values, self._relations, self._pk, self._prefix
+
+    def __setstate__(self, state):
+        self._values, self._relations, self._pk, self._prefix = state
+
+    def __repr__(self):
+        return "<ValuesRecord: %s>" % self._values
+
+
+class QueryPlan(object):
+    """
+        inspects the columns of a datasource and compiles the ones that read
+        plain field paths (ie. `employee.contract.type`) into a `values()` projection.
+
+        `unresolved` lists the columns that need the model instances: callables,
+        `ColumnCallable`, properties, methods...
+
+        `select_related` and `prefetch_related` are the lookups needed to read
+        the columns and the extra `paths` (ie. group_by, order_by) from the model instances.
+        The relations read by the unresolved columns are unknown: if there are any,
+        `select_related` includes the not null foreign keys (see `get_default_related()`).
+
+        `extra_select` {alias: sql} holds the CalcColumns computed by the database
+        (see `get_calc_sql()`); `aliases` maps their names to the aliases.
+
+        `tables` are the tables of the related models read by the columns and the `paths`.
+    """
+
+    def __init__(self, model, columns, paths=(), using=None):
+        self.model = model
+        self.pk = model._meta.pk.name
+        self.lookups = [self.pk]
+        self.relations = set()
+        self.unresolved = []
+        self.extra_select = OrderedDict()
+        self.aliases = {}
+        connection = connections[using or router.db_for_read(model)]
+
+        for col in columns:
+            sql = get_calc_sql(model, col, connection)
+            if sql:
+                self.extra_select[col.sql_alias] = sql
+                self.aliases[col.name] = col.sql_alias
+                self._add_lookup(col.sql_alias)
+                continue
+            fields = reads_attr(col) and resolve_field_path(model, col.attr)
+            if not fields:
+                self.unresolved.append(col.name)
+                continue
+            names = [f.name for f in fields]
+            for i in range(1, len(names)):
+                relation = "__".join(names[:i])
+                self.relations.add(relation)
+                self._add_lookup(relation)
+            self._add_lookup("__".join(names))
+        self.relations = frozenset(self.relations)
+
+        select_related, prefetch_related, tables = set(), set(), set()
+        for path in [p for col in columns for p in get_column_paths(col)] + list(paths):
+            tables.update(get_related_tables(model, path))
+            select, prefetch = get_related_lookups(model, path)
+            if select:
+                select_related.add(select)
+            if prefetch:
+                prefetch_related.add(prefetch)
+        if self.unresolved:
+            # as the blanket select_related() used before the plan
+            for lookup in get_default_related(model):
+                select_related.add(lookup)
+                tables.update(get_related_tables(model, lookup.replace('__', '.')))
+        # `a__b` already selects `a`
+        self.select_related = tuple(sorted(s for s in select_related
+                                           if not any(o.startswith(s + '__') for o in select_related)))
+        self.prefetch_related = tuple(sorted(prefetch_related))
+        self.tables = frozenset(tables)
+
+    def _add_lookup(self, lookup):
+        if lookup not in self.lookups:
+            self.lookups.append(lookup)
+
+    @property
+    def projectable(self):
+        return not self.unresolved
+
+    def record(self, values):
+        return ValuesRecord(values, self.relations, self.pk)
+
+    def get_order_by(self, order_by):
+        """
+            translates the names of the CalcColumns computed by the database to their aliases
+        """
+        ret = []
+        for lookup in order_by:
+            name = lookup.lstrip('-')
+            if name in self.aliases:
+                lookup = lookup[:len(lookup) - len(name)] + self.aliases[name]
+            ret.append(lookup)
+        return ret
+
+    def __repr__(self):
+        return "<QueryPlan: %s values=%s select_related=%s prefetch_related=%s>" % (self.model.__name__,
+                                                                                   self.lookups,
+                                                                                   self.select_related,
+                                                                                   self.prefetch_related)
@@ -19,6 +19,7 @@ class Registry(object):
         super(Registry, self).__init__()
         self.reports = []
         self.monitors = []
+        self._tables = None
 
     def register(self, report_class):
         model = get_attr(report_class, 'datasource.model', None)
@@ -30,6 +31,24 @@ class Registry(object):
             monitor_model(model)
 
         self.reports.append(_Entry(fqn(report_class), report_class))
+        self._tables = None
+
+    def get_tables(self):
+        """
+            returns the set of the tables read by the registered reports that use the cache,
+            computed once (see `ereports.engine.cache.invalidate_table()`)
+        """
+        if self._tables is None:
+            tables = set()
+            for entry in self:
+                try:
+                    datasource = entry.type.as_report().datasource
+                    if datasource.use_cache:
+                        tables.update(datasource.get_dependent_tables() or [])
+                except Exception as e:
+                    logger.error("Unable to read the tables of {0}: {1}".format(entry.classname, e))
+            self._tables = tables
+        return self._tables
 
     def __iter__(self):
         for el in self.reports:
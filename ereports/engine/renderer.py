@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from django.http import HttpResponse
 from django.template import RequestContext
+from ereports.engine.columns import OptionalColumn
+from ereports.engine.errors import ErrorsView
 from ereports.engine.mixins import TemplateRender, ReportRender, XlsRender
 
 DEFAULT_FILENAME = 'report'
@@ -26,9 +28,14 @@ class BaseHtmlRender(ReportRender, TemplateRender):
         return HttpResponse(self.render(request, context))
 
     def get_extra_context(self):
+        # the errors are counted while the rows are rendered, display them after the data.
+        # The missing values of the optional columns are logged only
+        datasource = self.report.datasource
+        optional = [c.name for c in datasource.columns if isinstance(c, OptionalColumn)]
+        context = {'ERRORS': ErrorsView(datasource.errors, optional)}
         if self.report.column_totals:
-            return {'SUMMARY_FIELDS': filter(lambda x: x in self.report.display_order(), self.report.column_totals)}
-        return {}
+            context['SUMMARY_FIELDS'] = filter(lambda x: x in self.report.display_order(), self.report.column_totals)
+        return context
 
 
 class BaseXlsRender(ReportRender, XlsRender):
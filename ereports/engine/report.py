@@ -1,16 +1,95 @@
 # -*- coding: utf-8 -*-
 from collections import defaultdict
+from decimal import Decimal
+from itertools import groupby
+import operator
+from operator import itemgetter
 from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Sum
 from django.utils.encoding import smart_text
 from six import iteritems, string_types
+from ereports.engine.columnar import ColumnarResult
+from ereports.engine.columns import DecimalColumn, identity
 from ereports.engine.config import ConfigurationForm
-from ereports.engine.datasource import Datasource, DatasourceRow
+from ereports.engine.datasource import Datasource, RawSQLDatasource, get_row_header
+from ereports.engine.planner import get_calc_fields, get_column_lookup, get_sum_lookup, resolve_field_path
 from ereports.engine.renderer import BaseHtmlRender
 from ereports.utils import get_attr, fqn
 
 
+# CalcColumn operations whose total is the combination of the totals of the fields
+LINEAR_OPERATORS = (operator.add, operator.sub)
+
+
+def accumulate(totals, name, value):
+    """
+        adds `value` to `totals[name]`. Not numeric values set the total to None
+    """
+    if name in totals and totals[name] is None:
+        return
+    try:
+        totals[name] = totals.get(name, 0) + (value or 0)
+    except TypeError:
+        totals[name] = None
+
+
+def aggregate_sums(datasource, columns, *group_by):
+    """
+        computes the sum of `columns` with a single query, grouped by the `group_by` lookups.
+        only the columns that read numeric fields, or add/subtract them
+        (see `ereports.engine.planner.get_calc_fields`), are computed.
+
+    :return: tuple (list of computed column names, list of dictionaries {name: total})
+    """
+    aggregates = {}
+    targets = {}
+    calcs = {}
+    if datasource._can_push_down():
+        for col in columns:
+            lookup = get_sum_lookup(datasource.model, col)
+            fields = get_calc_fields(datasource.model, col)
+            if lookup:
+                alias = 'ereports_total_%s' % col.name
+                aggregates[alias] = Sum(lookup)
+                targets[alias] = col
+            elif fields and col.op in LINEAR_OPERATORS:
+                # sum(a + b) == sum(a) + sum(b)
+                calcs[col] = []
+                for i, field in enumerate(fields):
+                    alias = 'ereports_total_%s_%s' % (col.name, i)
+                    aggregates[alias] = Sum(field.name)
+                    calcs[col].append(alias)
+                if col.initial:
+                    aggregates['ereports_count'] = Count('pk')
+    if not aggregates:
+        return [], []
+
+    qs = datasource._get_queryset()
+    if group_by:
+        results = list(qs.values(*group_by).annotate(**aggregates).order_by())
+    else:
+        results = [qs.aggregate(**aggregates)]
+    for values in results:
+        for alias, col in targets.items():
+            value = values.pop(alias)
+            if value is not None and isinstance(col, DecimalColumn) and not isinstance(value, Decimal):
+                # str(): the decimal representation of a float, not its binary expansion
+                value = Decimal(str(value))
+            values[col.name] = value
+        count = values.pop('ereports_count', 0)
+        for col, aliases in calcs.items():
+            value = col.initial * count
+            for alias in aliases:
+                term = values.pop(alias)
+                value = None if term is None or value is None else col.op(term, value)
+            values[col.name] = value
+    return [col.name for col in list(targets.values()) + list(calcs)], results
+
+
 class Group(list):
-    pass
+    def __init__(self, *args, **kwargs):
+        super(Group, self).__init__(*args, **kwargs)
+        self.totals = {}
 
 
 class BaseGrouper(object):
@@ -22,28 +101,97 @@ class BaseGrouper(object):
         self._dict = defaultdict(Group)
         self._processed = False
 
+    def _get_group_lookup(self):
+        """
+            returns the ORM lookup of the field used to group or None if
+            groups are not computed from a concrete field.
+        """
+        model = self.report.datasource.model
+        if not isinstance(self.group_by, string_types) or model is None:
+            return None
+        try:
+            column = self.report.get_column_by_name(self.group_by)
+        except KeyError:
+            fields = resolve_field_path(model, self.group_by)
+            if fields:
+                return "__".join(f.name for f in fields)
+        else:
+            # groups are named by the values of the column, manipulator applied
+            if column._manipulator is identity:
+                return get_column_lookup(model, column)
+
+    def _get_row_value(self, datasourcerow, attr, datasource):
+        """
+            returns the value of `attr` (column name, attribute path or callable) for `datasourcerow`:
+            the value of the cell (manipulator applied) if `attr` is a column.
+            Rows of columnar and spilled results do not keep the records: only columns can be read.
+        """
+        if isinstance(attr, string_types) and attr in datasourcerow:
+            return datasourcerow[attr].value
+        if datasourcerow._original is None:
+            raise ImproperlyConfigured(u"Cannot group or order by `%s`: the rows of %s do not keep the records. "
+                                       u"Add it to the columns" % (attr, datasource.__class__.__name__))
+        if callable(attr):
+            return attr(datasourcerow._original)
+        return get_attr(datasourcerow._original, attr)
+
+    def _get_group_name(self, datasourcerow, datasource):
+        return self._get_row_value(datasourcerow, self.group_by, datasource)
+
+    def _get_subtotals(self):
+        """
+            computes the subtotals of the numeric fields in `report.column_totals`
+            with a single grouped query.
+
+        :return: tuple (list of computed column names, dictionary {group: {name: total}})
+        """
+        lookup = self._get_group_lookup()
+        if lookup is None or not self.report.column_totals:
+            return [], {}
+        columns = [self.report.get_column_by_name(name) for name in self.report.column_totals]
+        names, results = aggregate_sums(self.report.datasource, columns, lookup)
+        return names, dict((values.pop(lookup), values) for values in results)
+
+    def _process_columns(self, data, to_sum, header):
+        """
+            builds the groups from the columns of a ColumnarResult: rows are grouped,
+            sorted and summed by column, then rebuilt with `header`.
+        """
+        for group_name, indices in data.group_indices(self.group_by).items():
+            indices = data.argsort(self.internal_order, indices)
+            group = self._dict[group_name]
+            group.extend(data.row(i, header) for i in indices)
+            for name in to_sum:
+                group.totals[name] = data.sum(name, indices)
+
     def _process(self):
         if self._processed:
             return
         ds = self.report.datasource
+        computed, subtotals = self._get_subtotals()
+        to_sum = [name for name in self.report.column_totals or [] if name not in computed]
+        header = get_row_header(self.report.display_order())
+        data = self.report._get_columnar_data()
+        if data is not None and self.group_by in data.header.index and self.internal_order in data.header.index:
+            self._process_columns(data, to_sum, header)
+            for group_name, group in self._dict.items():
+                group.totals.update(subtotals.get(group_name, {}))
+            self._processed = True
+            return
         # record is a DatasourceRow instance
+        order = defaultdict(list)  # {group: [(internal order value, row)]}
         for datasourcerow in ds:
-            if callable(self.group_by):
-                group_name = self.group_by(datasourcerow._original)
-            elif isinstance(self.group_by, string_types):
-                try:
-                    col = self.report.get_column_by_name(self.group_by)
-                    group_name = col.get_value(datasourcerow._original, self.report.datasource).value
-                except KeyError:
-                    group_name = get_attr(datasourcerow._original, self.group_by)
-            else:
-                group_name = get_attr(datasourcerow._original, self.group_by)
-
-            #datasourcerow._sort_func = self.report._order_columns
-            orderedrow = DatasourceRow([(name, datasourcerow[name]) for name in self.report.display_order()])
-            orderedrow._original = datasourcerow._original
-            self._dict[group_name].append(orderedrow)
+            group_name = self._get_group_name(datasourcerow, ds)
 
+            group = self._dict[group_name]
+            order[group_name].append((self._get_row_value(datasourcerow, self.internal_order, ds),
+                                      datasourcerow.select(header)))
+            for name in to_sum:
+                accumulate(group.totals, name, datasourcerow[name].value)
+
+        for group_name, group in self._dict.items():
+            group.extend(row for __, row in sorted(order[group_name], key=itemgetter(0)))
+            group.totals.update(subtotals.get(group_name, {}))
         self._processed = True
 
     def values(self):
@@ -57,12 +205,9 @@ class BaseGrouper(object):
     groups = keys
 
     def items(self):
+        # the group elements are ordered by `_process()`
         self._process()
 
-        # order internal group elements
-        for group_name, rows in self._dict.items():
-            rows.sort(key=lambda x: get_attr(x._original, self.internal_order))
-
         #returns groups ordered
         sorted_groups = zip(self._dict.keys(), self._dict.values())
         sorted_groups.sort(key=lambda x: smart_text(x[0]))
@@ -70,6 +215,57 @@ class BaseGrouper(object):
         return sorted_groups
 
 
+class StreamingGrouper(BaseGrouper):
+    """
+        Grouper that lets the database sort the records by (group, internal order)
+        and builds the groups in a single pass over `Datasource.stream()`,
+        so only one group at time is kept in memory.
+
+        `items()` returns a generator; groups and rows follow the database ordering.
+        If the group or the internal order are not concrete fields, or the datasource
+        result is already in memory, it behaves as BaseGrouper.
+    """
+
+    def _get_order_lookup(self):
+        model = self.report.datasource.model
+        if not isinstance(self.internal_order, string_types) or model is None:
+            return None
+        try:
+            return get_column_lookup(model, self.report.get_column_by_name(self.internal_order))
+        except KeyError:
+            fields = resolve_field_path(model, self.internal_order)
+            if fields:
+                return "__".join(f.name for f in fields)
+
+    def items(self):
+        group_lookup = self._get_group_lookup()
+        order_lookup = self._get_order_lookup()
+        if group_lookup is None or order_lookup is None or self.report.datasource._result_cache is not None:
+            return super(StreamingGrouper, self).items()
+        return self._iter_groups(group_lookup, order_lookup)
+
+    def _iter_groups(self, group_lookup, order_lookup):
+        ds = self.report.datasource._clone()
+        # the rows are the ones of the report: so are the errors and the discarded rows
+        ds.errors = self.report.datasource.errors
+        ds.filter_stats = self.report.datasource.filter_stats
+        ds.order_by = [group_lookup, order_lookup] + list(self.report.order_by or [])
+        ds._queryset = None
+        ds._query_plan = None
+
+        computed, subtotals = self._get_subtotals()
+        to_sum = [name for name in self.report.column_totals or [] if name not in computed]
+        header = get_row_header(self.report.display_order())
+        for group_name, rows in groupby(ds.stream(), lambda row: self._get_group_name(row, ds)):
+            group = Group()
+            for datasourcerow in rows:
+                group.append(datasourcerow.select(header))
+                for name in to_sum:
+                    accumulate(group.totals, name, datasourcerow[name].value)
+            group.totals.update(subtotals.get(group_name, {}))
+            yield group_name, group
+
+
 class BaseReport(object):
     title = None
     description = None
@@ -89,6 +285,7 @@ class BaseReport(object):
 
     def __init__(self, **kwargs):
         self.extras = kwargs.pop('extras', {})
+        self._totals = {}
         for key, value in iteritems(kwargs):
             setattr(self, key, value)
         self.title = self.title or fqn(self)
@@ -118,9 +315,21 @@ class BaseReport(object):
         else:
             raise ImproperlyConfigured(u"%(cls)s is missing a datasource. Define "
                                        u"%(cls)s.model, %(cls)s.datasource" % {'cls': cls.__name__})
+        if initkwargs.get('list_filter', cls.list_filter):
+            cls.check_filterable(initkwargs['datasource'])
 
         return cls(**initkwargs)
 
+    @classmethod
+    def check_filterable(cls, datasource):
+        """
+            raises ImproperlyConfigured if the rows of `datasource` cannot be filtered (ie. raw SQL queries)
+        """
+        if isinstance(datasource, RawSQLDatasource):
+            raise ImproperlyConfigured(u"%(cls)s cannot filter the rows of %(ds)s, a raw SQL query: "
+                                       u"remove the filters" % {'cls': cls.__name__,
+                                                                'ds': datasource.__class__.__name__})
+
     def display_order(self):
         """
             returns the order and the column names to display
@@ -138,11 +347,30 @@ class BaseReport(object):
         :return:
         """
         if self.list_display:
-            return DatasourceRow([(name, row[name]) for name in self.list_display])
+            return row.select(get_row_header(self.list_display))
         return row
 
+    def get_required_columns(self):
+        """
+            returns the names of the columns needed to produce the report: displayed,
+            grouped on, ordered by, totalled and `sys_only`
+        :return: list
+        """
+        names = list(self.display_order())
+        names.extend(attr for attr in self.group_by or [] if isinstance(attr, string_types))
+        names.extend(lookup.lstrip('-') for lookup in self.order_by or [])
+        names.extend(self.column_totals or [])
+        names.extend(c.name for c in self.datasource.columns if c.sys_only)
+        available = set(c.name for c in self.datasource.columns)
+        required = []
+        for name in names:
+            if name in available and name not in required:
+                required.append(name)
+        return required
+
     def __iter__(self):
         self.datasource.order_by = self.order_by
+        self.datasource.required_columns = self.get_required_columns()
         if self.group_by:
             g = self.get_groups()
             for group, rows in g:
@@ -152,6 +380,14 @@ class BaseReport(object):
             for row in self.datasource:
                 yield self._order_columns(row)
 
+    def __aiter__(self):
+        """
+            asynchronous iteration (`async for row in report`), see `Datasource.__aiter__`
+        """
+        from ereports.engine.aio import AsyncIterator
+
+        return AsyncIterator(self.__iter__, self.datasource.chunk_size)
+
     def __getitem__(self, item):
         rows = self.datasource[item]
         if isinstance(rows, (slice, list, tuple)):
@@ -176,8 +412,49 @@ class BaseReport(object):
         :param column_name:
         :return:
         """
+        data = self._get_columnar_data()
+        if data is not None:
+            return data.values(column_name)
+        return [row[column_name].value for row in self.datasource]
+
+    def _get_columnar_data(self):
+        """
+            returns the datasource result if it is materialized by column (see `Datasource.columnar`)
+        :return: ColumnarResult or None
+        """
         ds = self.datasource
-        return [row[column_name].value for row in ds]
+        if ds.columnar and not ds.streaming:
+            data = ds.get_data()
+            if isinstance(data, ColumnarResult):
+                return data
+
+    def get_totals(self, column_names=None):
+        """
+            returns a dictionary {column name: total} for `column_names`, default to `column_totals`.
+            The columns that read numeric fields are summed with a single `aggregate()` query,
+            the others with a single pass over the datasource rows.
+            The total of a column with not numeric values is None.
+        :param column_names: list of column names
+        :return: dict
+        """
+        names = list(column_names or self.column_totals or [])
+        missing = [name for name in list(self.column_totals or []) + names if name not in self._totals]
+        if missing:
+            columns = [self.get_column_by_name(name) for name in set(missing)]
+            computed, results = aggregate_sums(self.datasource, columns)
+            if results:
+                self._totals.update(results[0])
+            to_sum = [col.name for col in columns if col.name not in computed]
+            data = self._get_columnar_data() if to_sum else None
+            if data is not None:
+                self._totals.update((name, data.sum(name)) for name in to_sum)
+            elif to_sum:
+                totals = {}
+                for row in self.datasource:
+                    for name in to_sum:
+                        accumulate(totals, name, row[name].value)
+                self._totals.update((name, totals.get(name, 0)) for name in to_sum)
+        return dict((name, self._totals[name]) for name in names)
 
     @property
     def headers(self):
@@ -205,5 +482,7 @@ class BaseReport(object):
             raise ImproperlyConfigured('Cannot use get_group() without set group_by')
 
         assert len(self.group_by) == 2, "Invalid GroupBy `%s`" % self.group_by
+        self.datasource.group_by = self.group_by
+        self.datasource.required_columns = self.get_required_columns()
         groups = self.grouper(self, *self.group_by)
         return groups.items()
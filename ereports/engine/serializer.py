@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+    serialization of the results stored in the cache (see `DatasourceCacheManager`).
+
+    the payload holds the column names once and the values column by column,
+    then it is compressed with zlib. Cells are rebuilt on load as RowValue bound
+    to the columns of the datasource.
+"""
+import zlib
+from six.moves import cPickle as pickle
+from ereports.engine.columnar import ColumnarResult
+from ereports.engine.columns import RowValue
+
+FORMAT_VERSION = 1
+COMPRESS_LEVEL = 6
+
+
+def dumps(result, level=COMPRESS_LEVEL):
+    """
+        returns the compressed payload of `result`, a ColumnarResult or a sequence of DatasourceRow
+    """
+    if isinstance(result, ColumnarResult):
+        payload = (FORMAT_VERSION, 'columnar', result.header, result.vectors)
+    else:
+        payload = (FORMAT_VERSION, 'rows') + _pack_rows(result)
+    return zlib.compress(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL), level)
+
+
+def loads(data, datasource):
+    """
+        returns the result stored by `dumps()` with rows of `datasource.RowClass`
+        and cells bound to `datasource.columns`, or None if `data` is not a valid payload
+    """
+    try:
+        payload = pickle.loads(zlib.decompress(data))
+    except (zlib.error, pickle.UnpicklingError, TypeError, ValueError, EOFError):
+        return None
+    if payload[0] != FORMAT_VERSION:
+        return None
+    kind, header = payload[1], payload[2]
+    shared = datasource._get_row_header()
+    if header is not None and shared.names == header.names:
+        header = shared
+    if kind == 'columnar':
+        return ColumnarResult(header, payload[3], datasource.RowClass, datasource.columns)
+    return _unpack_rows(header, datasource, *payload[3:])
+
+
+def _pack_rows(rows):
+    """
+        returns (header, values by column, other cells {(row, column): cell}, originals or None)
+    """
+    header = rows[0]._header if rows else None
+    width = len(header.names) if header else 0
+    values = [[] for __ in range(width)]
+    others = {}
+    originals = []
+    for i, row in enumerate(rows):
+        for j, cell in enumerate(row._get_values()):
+            if type(cell) is RowValue:
+                values[j].append(cell.value)
+            else:
+                # RowValueError or values set by the reports
+                values[j].append(None)
+                others[i, j] = cell
+        originals.append(row._original)
+    if not any(obj is not None for obj in originals):
+        originals = None
+    return header, values, others, originals
+
+
+def _unpack_rows(header, datasource, values, others, originals):
+    if header is None:
+        return ()
+    columns = dict((c.name, c) for c in datasource.columns)
+    bound = [columns.get(name) for name in header.names]
+    table = [[RowValue(value, column) for value, column in zip(cells, bound)] for cells in zip(*values)]
+    for (i, j), cell in others.items():
+        table[i][j] = cell
+    RowClass = datasource.RowClass
+    return tuple(RowClass(header=header, values=cells, original=originals[i] if originals else None)
+                 for i, cells in enumerate(table))
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+from array import array
+import mmap
+import tempfile
+from six.moves import cPickle as pickle
+from ereports.engine.columns import RowValue
+
+
+def spill_rows(header, rows, RowClass, columns=None, threshold=10000, dir=None):
+    """
+        materializes `rows`: returns a tuple if there are at most `threshold` rows,
+        a SpilledResult otherwise.
+
+        >>> spill_rows(None, iter([1, 2]), None)
+        (1, 2)
+    """
+    buffer = []
+    rows = iter(rows)
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) > threshold:
+            writer = SpilledResult.create(header, RowClass, columns, dir)
+            writer.extend(buffer)
+            del buffer[:]
+            writer.extend(rows)
+            return writer.close_writer()
+    return tuple(buffer)
+
+
+class SpilledResult(object):
+    """
+        materialized result of a Datasource stored in a temporary file (see `Datasource.spill_threshold`).
+
+        each row is written as the pickle of its cells, `offsets` keeps the position
+        of the rows in the file, which is read through a memory-mapped view.
+        Behaves as the tuple of DatasourceRow used by default, rows are rebuilt when
+        accessed and their `_original` is None: the groupers of the reports read only
+        their columns (see `BaseGrouper._get_row_value()`).
+        The file is removed when the result is closed or garbage collected,
+        spilled results are never stored in the cache.
+    """
+
+    def __init__(self, header, RowClass, columns, file):
+        self.header = header
+        self.RowClass = RowClass
+        self.columns = dict((c.name, c) for c in columns or [])
+        self.offsets = array('l', [0])
+        self._file = file
+        self._map = None
+
+    @classmethod
+    def create(cls, header, RowClass, columns=None, dir=None):
+        return cls(header, RowClass, columns, tempfile.TemporaryFile(prefix='ereports', dir=dir))
+
+    def append(self, row):
+        pickle.dump(tuple(row.itervalues()), self._file, pickle.HIGHEST_PROTOCOL)
+        self.offsets.append(self._file.tell())
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def close_writer(self):
+        """
+            flushes the file and maps it in memory, no more rows can be added
+        """
+        self._file.flush()
+        if len(self):
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def __getitem__(self, k):
+        length = len(self)
+        if isinstance(k, slice):
+            return tuple(self.row(i) for i in range(*k.indices(length)))
+        if k < 0:
+            k += length
+        if not 0 <= k < length:
+            raise IndexError("SpilledResult index out of range")
+        return self.row(k)
+
+    def row(self, i):
+        cells = pickle.loads(self._map[self.offsets[i]:self.offsets[i + 1]])
+        for name, cell in zip(self.header.names, cells):
+            if isinstance(cell, RowValue):
+                cell.column = self.columns.get(name)
+        return self.RowClass(header=self.header, values=cells)
+
+    def __getstate__(self):
+        raise TypeError("SpilledResult cannot be pickled")
+
+    def __repr__(self):
+        return "<SpilledResult: %d rows %s>" % (len(self), self.header.names)
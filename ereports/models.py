@@ -4,6 +4,7 @@ import string
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.db import models
+from ereports.engine import cache  # noqa, connects the table generations used by the cache keys
 
 
 clean_field = lambda field: field.replace('.', '__').strip()
@@ -105,7 +105,13 @@ def subtotal(report, rows, col):
     try:
         if isinstance(col, string_types):
             col = report.get_column_by_name(col)
-        tot = sum(r[col.name].value or 0 for r in rows)
+        totals = getattr(rows, 'totals', None)
+        if totals and col.name in totals:
+            tot = totals[col.name]
+            if tot is None:
+                return 0
+        else:
+            tot = sum(r[col.name].value or 0 for r in rows)
         return format_raw_value(RowValue(tot, col))
     except TypeError:
         return 0
@@ -116,8 +122,10 @@ def total(report, col):
     try:
         if isinstance(col, string_types):
             col = report.get_column_by_name(col)
-        values = report.get_column_values(col.name)
-        return format_raw_value(RowValue(sum(values), col))
+        tot = report.get_totals([col.name])[col.name]
+        if tot is None:
+            return 0
+        return format_raw_value(RowValue(tot, col))
     except TypeError:
         return 0
 
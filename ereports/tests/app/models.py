@@ -73,3 +73,7 @@ class DemoModel(models.Model):
     @property
     def attribute_property(self):
         return "property"
+
+
+class SimpleDemoChildModel(SimpleDemoModel):
+    extra = models.IntegerField(default=0)
@@ -0,0 +1,41 @@
+from unittest import TestCase, skipIf
+from ereports.engine.aio import asyncio, AsyncIterator, StopAsyncIteration
+from ereports.engine.columns import RowValue
+from ereports.engine.datasource import Datasource, DatasourceRow
+from ereports.tests.app.models import SimpleDemoModel
+
+
+def consume(loop, iterator):
+    items = []
+    while True:
+        try:
+            items.append(loop.run_until_complete(iterator.__anext__()))
+        except StopAsyncIteration:
+            return items
+
+
+@skipIf(asyncio is None, "python 3.5.2+ required")
+class TestAsyncIterator(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_iterate(self):
+        iterator = AsyncIterator(lambda: range(5), chunk_size=2)
+        self.assertIs(iterator.__aiter__(), iterator)
+        self.assertEqual(consume(self.loop, iterator), [0, 1, 2, 3, 4])
+
+    def test_aclose(self):
+        iterator = AsyncIterator(lambda: range(5), chunk_size=2)
+        self.assertEqual(self.loop.run_until_complete(iterator.__anext__()), 0)
+        self.loop.run_until_complete(iterator.aclose())
+        self.assertEqual(consume(self.loop, iterator), [])
+
+    def test_datasource(self):
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char'])
+        ds._result_cache = tuple(DatasourceRow([('char', RowValue(c))]) for c in 'abc')
+        self.assertEqual(consume(self.loop, ds.__aiter__()), list(ds))
+        self.assertEqual(self.loop.run_until_complete(ds.aget_data()), ds._result_cache)
@@ -0,0 +1,121 @@
+"""
+    timings of the compiled code paths against the legacy ones, run only
+    if EREPORTS_BENCHMARKS is set (ie. `EREPORTS_BENCHMARKS=1 py.test ereports/tests/engine/benchmarks.py`)
+"""
+import copy
+import os
+import pickle
+import timeit
+import pytest
+from ereports.tests.app.models import SimpleDemoModel
+from ereports.engine.columns import Column, CalcColumn, NOTFOUND
+from ereports.engine import serializer
+from ereports.engine.datasource import Datasource, DatasourceRow, RecordFilteredError, get_row_header
+from ereports.utils import get_attr, attr_getter
+
+pytestmark = pytest.mark.skipif(not os.environ.get('EREPORTS_BENCHMARKS'), reason="EREPORTS_BENCHMARKS not set")
+
+NUMBER = 20000
+
+
+class Record(object):
+    pass
+
+
+def get_record():
+    record = Record()
+    record.employee = Record()
+    record.employee.contract = Record()
+    record.employee.contract.type = 'fixed'
+    return record
+
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=NUMBER, repeat=repeat))
+
+
+def test_attr_getter():
+    record = get_record()
+    getter = attr_getter('employee.contract.type', NOTFOUND)
+
+    legacy = best_of(lambda: get_attr(record, 'employee.contract.type', object()))
+    compiled = best_of(lambda: getter(record))
+    assert compiled < legacy
+
+
+def test_column_get_value():
+    record = get_record()
+    column = Column('employee.contract.type')
+
+    def legacy_get_value():
+        notfound = object()
+        attr = get_attr(record, column.attr, notfound)
+        if attr is notfound or callable(attr):
+            raise AssertionError
+        return attr
+
+    legacy = best_of(legacy_get_value)
+    compiled = best_of(lambda: column._get_value_from_attr(record, column.attr, None))
+    assert compiled < legacy
+
+
+def test_filter_records():
+    class RaiseDatasource(Datasource):
+        def filter_record(self, obj):
+            if obj.integer1 % 10:
+                raise RecordFilteredError
+
+    class ReturnDatasource(Datasource):
+        def filter_record(self, obj):
+            return not obj.integer1 % 10
+
+    class BatchDatasource(Datasource):
+        def filter_records(self, objects):
+            return [obj for obj in objects if not obj.integer1 % 10]
+
+    objects = [SimpleDemoModel(integer1=i) for i in range(100)]
+    timings = []
+    for klass in (RaiseDatasource, ReturnDatasource, BatchDatasource):
+        ds = klass.as_datasource(model=SimpleDemoModel, columns=['integer1'])
+        assert len(ds.filter_records(objects)) == 10
+        timings.append(min(timeit.repeat(lambda: ds.filter_records(objects), number=NUMBER // 100, repeat=3)))
+    raised, returned, batch = timings
+    assert returned < raised
+    assert batch < raised
+
+
+def test_datasource_clone():
+    columns = [Column('char', manipulator=lambda v: v) for __ in range(25)]
+    columns += [CalcColumn(['integer1', 'integer2']) for __ in range(25)]
+    ds = Datasource.as_datasource(model=SimpleDemoModel, columns=columns)
+    ds.add_filters(char='abc')
+
+    def legacy_clone():
+        c = Datasource()
+        c.__dict__.update(copy.deepcopy(ds.__dict__))
+        return c
+
+    legacy = min(timeit.repeat(legacy_clone, number=NUMBER // 100, repeat=3))
+    clone = min(timeit.repeat(ds._clone, number=NUMBER // 100, repeat=3))
+    assert clone * 10 < legacy
+
+
+def test_serializer():
+    ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char', 'integer1', 'integer2', 'boolean'])
+    header = ds._get_row_header()
+    rows = tuple(DatasourceRow(header=header, values=[c.get_cells([obj], ds)[0] for c in ds.columns])
+                 for obj in [SimpleDemoModel(id=i, char='office %s' % (i % 20), integer1=i % 7, integer2=i,
+                                             boolean=bool(i % 2)) for i in range(1000)])
+    assert header is get_row_header(header.names)
+
+    pickled = pickle.dumps(rows, pickle.HIGHEST_PROTOCOL)
+    packed = serializer.dumps(rows)
+    number = NUMBER // 5000
+    dumps_pickle, dumps, loads_pickle, loads = [
+        min(timeit.repeat(func, number=number, repeat=3))
+        for func in (lambda: pickle.dumps(rows, pickle.HIGHEST_PROTOCOL), lambda: serializer.dumps(rows),
+                     lambda: pickle.loads(pickled), lambda: serializer.loads(packed, ds))]
+    assert serializer.loads(packed, ds) == rows
+    assert len(packed) * 5 < len(pickled)
+    assert dumps < dumps_pickle
+    assert loads < loads_pickle
@@ -2,14 +2,18 @@ import pickle
 from django.contrib.contenttypes.models import ContentType
 from django_dynamic_fixture import G
 import mock
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.core import cache
 from django.contrib.auth.models import Permission
 from django.test.testcases import TestCase, _AssertNumQueriesContext
-from ereports.engine.cache import monitor_model, reset, DatasourceCacheManager
+from ereports.engine.cache import monitor_model, reset, DatasourceCacheManager, IncrementalCacheManager, \
+    DummyCacheManager
 from ereports.engine.datasource import Datasource
 from django.db import connections
 from ereports.engine.report import BaseReport
-from ereports.tests.app.models import SimpleDemoModel
+from ereports.engine.registry import Registry
+from ereports.tests.app.models import SimpleDemoModel, DemoModel, DemoModelDetail, DemoOptionalModel, \
+    SimpleDemoChildModel
 
 locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
 dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
@@ -56,6 +60,71 @@ class TestDatasourceCacheManager(TestCase):
                                           '/django.contrib.contenttypes.models.ContentType/0/'), k2)
 
 
+    def test_table_monitors(self):
+        # connected at startup, before any key is computed
+        for signal in (post_save, post_delete, m2m_changed):
+            self.assertTrue(signal.has_listeners(ContentType))
+        registry = Registry()
+        ds = Datasource.as_datasource(model=Permission, columns=['name', 'content_type.app_label'], use_cache=True)
+        registry.register(type('PermissionReport', (BaseReport,), {'datasource': ds}))
+        with mock.patch('ereports.engine.cache._cache', locmem_cache), \
+                mock.patch('ereports.engine.registry.registry', registry):
+            locmem_cache.clear()
+            ContentType.objects.create(app_label='x', model='y')
+            self.assertEqual(DatasourceCacheManager().get_table_gen_part('django_content_type'),
+                             ('django_content_type', 1))
+
+            # not read by the registered reports or by the keys of the process
+            G(DemoOptionalModel, user=None)
+            self.assertIsNone(locmem_cache.get('ereports/tables/%s' % DemoOptionalModel._meta.db_table))
+
+    def test_key_length(self):
+        manager = DatasourceCacheManager()
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            ds = Datasource.as_datasource(model=DemoModel, columns=['char', 'group.user.username', 'group.name'],
+                                          dependent_models=[Permission, ContentType, SimpleDemoModel])
+            ds.add_filters(m2m__name='abc')
+            self.assertGreater(len(ds.get_dependent_tables()), 3)
+            self.assertLessEqual(len(manager.get_key(ds)), 250)
+            ds.dependent_models = [type('Model%s' % i, (object,), {'__module__': 'x' * 50}) for i in range(5)]
+            key = manager.get_key(ds)
+            self.assertLessEqual(len(key), 250)
+            self.assertEqual(key, manager.get_key(ds))
+
+    def test_inherited_table(self):
+        manager = DatasourceCacheManager()
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            locmem_cache.clear()
+            monitor_model(SimpleDemoModel)
+            ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char'], use_cache=True)
+            k1 = manager.get_key(ds)
+            SimpleDemoChildModel.objects.create(char='abc', integer1=1)  # post_save of the child only
+            self.assertNotEqual(manager.get_key(ds), k1)
+            self.assertEqual(manager.get_last_cache_version(SimpleDemoModel), 1)
+
+    def test_table_generation(self):
+        manager = DatasourceCacheManager()
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            locmem_cache.clear()
+            instance = G(DemoModel)
+            detail = G(DemoModelDetail)
+            ds = Datasource.as_datasource(model=DemoModel, columns=['char', 'group.name'], use_cache=True)
+            ds.add_filters(m2m__name='abc')
+            tables = ds.get_dependent_tables()
+            self.assertIn('app_demomodelgroup', tables)
+            self.assertIn('ereports_demoapp_demomodel_m2m', tables)
+
+            k1 = manager.get_key(ds)
+            generation = manager.get_table_gen_part('app_demomodelgroup')[1]
+            instance.group.save()
+            k2 = manager.get_key(ds)
+            self.assertNotEqual(k1, k2)
+            self.assertEqual(manager.get_table_gen_part('app_demomodelgroup')[1], generation + 1)
+            instance.m2m.add(detail)
+            k3 = manager.get_key(ds)
+            self.assertNotEqual(k2, k3)
+            self.assertEqual(k3, manager.get_key(ds))
+
 class TestCacheDatasource(TestCase):
     def test_queryset_no_hit_db(self):
         TestDatasource = type('TestDatasource', (Datasource,), {'model': Permission,
@@ -177,6 +246,100 @@ class TestCacheDatasource(TestCase):
                 list(ds2)
 
 
+class TestIncrementalCache(TestCase):
+    def get_datasource(self):
+        ds = Datasource.as_datasource(model=SimpleDemoModel, use_cache=True, cache_manager=IncrementalCacheManager(),
+                                      columns=['id', 'char', 'integer1'], order_by=['-integer1', 'id'])
+        ds.add_filters(char='abc')
+        return ds
+
+    def test_patch(self):
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            locmem_cache.clear()
+            monitor_model(SimpleDemoModel)
+            reset(SimpleDemoModel)
+            records = [G(SimpleDemoModel, char='abc', integer1=i) for i in range(4)]
+            list(self.get_datasource())
+
+            records[0].integer1 = 10  # moved
+            records[0].save()
+            records[1].char = 'xyz'  # filtered out
+            records[1].save()
+            records[2].delete()
+            G(SimpleDemoModel, char='abc', integer1=5)  # added
+            G(SimpleDemoModel, char='xyz', integer1=5)  # not matching
+
+            ds = self.get_datasource()
+            with _AssertNumQueriesContext(self, 1, connections['default']):
+                rows = list(ds)
+            fresh = self.get_datasource()
+            fresh.cache_manager = DummyCacheManager()
+            self.assertSequenceEqual(rows, list(fresh))
+            self.assertSequenceEqual([row.integer1.value for row in rows], [10, 5, 3])
+
+            # the patched result is stored
+            with _AssertNumQueriesContext(self, 0, connections['default']):
+                self.assertSequenceEqual(list(self.get_datasource()), rows)
+
+    def test_overlapping_runs(self):
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            locmem_cache.clear()
+            record = G(SimpleDemoModel, char='abc', integer1=1)
+            ds_a = self.get_datasource()
+            ds_b = ds_a._clone()
+            self.assertIs(ds_a.cache_manager, ds_b.cache_manager)
+            self.assertIsNone(ds_a.cache_manager.load(ds_a))
+            rows_a = ds_a._create_result_cache()
+            record.integer1 = 2
+            record.save()
+            list(ds_b)  # loads and saves
+            ds_a.cache_manager.save(ds_a, rows_a)  # stored with the generation read by its load
+
+            with _AssertNumQueriesContext(self, 1, connections['default']):
+                self.assertSequenceEqual(list(self.get_datasource()), [(record.pk, u'abc', 2)])
+
+    def test_save_without_load(self):
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            locmem_cache.clear()
+            ds = self.get_datasource()
+            ds.cache_manager.save(ds, ())
+            self.assertIsNone(ds.cache_manager.load(ds))
+
+    def test_monitor_once(self):
+        ds = self.get_datasource()
+        with mock.patch('ereports.engine.cache.monitor_model') as monitor:
+            ds.cache_manager.get_key(ds)
+            ds.cache_manager.get_key(ds)
+        self.assertEqual(monitor.call_count, 1)
+
+    def test_not_monitored_model(self):
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            locmem_cache.clear()
+            G(DemoOptionalModel, n=5, user=None)
+
+            def get_datasource():
+                return Datasource.as_datasource(model=DemoOptionalModel, use_cache=True, columns=['id', 'name'],
+                                                cache_manager=IncrementalCacheManager())
+
+            self.assertEqual(len(list(get_datasource())), 5)
+            G(DemoOptionalModel, user=None)
+            self.assertEqual(len(list(get_datasource())), 6)
+
+    def test_missing_changes(self):
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            locmem_cache.clear()
+            monitor_model(SimpleDemoModel)
+            reset(SimpleDemoModel)
+            record = G(SimpleDemoModel, char='abc', integer1=1)
+            list(self.get_datasource())
+            record.save()
+            locmem_cache.clear()  # changes evicted
+            ds = self.get_datasource()
+            with mock.patch.object(ds, 'patch_result') as patch_result:
+                self.assertSequenceEqual(list(ds), [(record.pk, u'abc', 1)])
+            self.assertFalse(patch_result.called)
+
+
 class TestCacheReport(TestCase):
     def test_cache(self):
         locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
@@ -0,0 +1,83 @@
+import datetime
+import pickle
+from django.test.testcases import TestCase
+from django_dynamic_fixture import G
+from ereports.engine.columnar import ColumnarResult, Vector
+from ereports.engine.columns import Column, ColumnCallable, RowValueError
+from ereports.engine.datasource import Datasource
+from ereports.tests.app.models import SimpleDemoModel, SimpleDateModel
+
+
+def get_error(obj, ds):
+    raise AttributeError
+
+
+class TestVector(TestCase):
+    def test_kinds(self):
+        self.assertEqual(Vector.from_values([1, None, 3]).kind, 'int')
+        self.assertEqual(Vector.from_values([1.5, 2.0]).kind, 'float')
+        self.assertEqual(Vector.from_values([True, False]).kind, 'bool')
+        self.assertEqual(Vector.from_values([datetime.date.today()]).kind, 'date')
+        self.assertEqual(Vector.from_values([datetime.datetime.now()]).kind, 'object')
+        self.assertEqual(Vector.from_values([u'a', u'b']).kind, 'str')
+        self.assertEqual(Vector.from_values([1, u'b']).kind, 'object')
+        self.assertEqual(Vector.from_values([2 ** 70]).kind, 'object')
+
+    def test_roundtrip(self):
+        today = datetime.date.today()
+        for values in ([1, None, 3], [True, None, False], [today, None], [u'a', None, u'a'], [1, u'b', None]):
+            self.assertEqual(Vector.from_values(values).tolist(), values)
+
+    def test_sum(self):
+        self.assertEqual(Vector.from_values([1, None, 3]).sum(), 4)
+        self.assertEqual(Vector.from_values([1, None, 3]).sum([1, 2]), 3)
+        self.assertIsNone(Vector.from_values([u'a', u'b']).sum())
+
+    def test_group_indices(self):
+        groups = Vector.from_values([u'b', u'a', None, u'b']).group_indices()
+        self.assertEqual(dict((k, list(v)) for k, v in groups.items()), {u'a': [1], u'b': [0, 3], None: [2]})
+
+    def test_argsort(self):
+        self.assertEqual(Vector.from_values([u'c', u'a', u'b']).argsort(), [1, 2, 0])
+        self.assertEqual(Vector.from_values([3, 1, 2]).argsort([0, 2]), [2, 0])
+
+
+class TestColumnarResult(TestCase):
+    def test_datasource(self):
+        G(SimpleDemoModel, char='abc', integer1=1, integer2=None)
+        G(SimpleDemoModel, char='xyz', integer1=2, integer2=5)
+        columns = ['char', 'integer1', 'integer2', 'boolean']
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=columns, columnar=True)
+        data = ds.get_data()
+        self.assertIsInstance(data, ColumnarResult)
+        self.assertSequenceEqual(list(ds), list(Datasource.as_datasource(model=SimpleDemoModel, columns=columns)))
+        self.assertEqual(len(data), 2)
+        self.assertEqual(ds[1], (u'xyz', 2, 5, False))
+        self.assertSequenceEqual(ds[-1:], [(u'xyz', 2, 5, False)])
+        self.assertIsNone(ds[0]._original)
+        self.assertIs(ds[0]['integer1'].column, ds.columns[1])
+        self.assertEqual(data.sum('integer2'), 5)
+
+    def test_dates(self):
+        today = datetime.date.today()
+        G(SimpleDateModel, char='abc', date=today, date_range=today)
+        ds = Datasource.as_datasource(model=SimpleDateModel, columns=['char', 'date'], columnar=True)
+        self.assertEqual(ds.get_data().vector('date').kind, 'date')
+        self.assertSequenceEqual(list(ds), [(u'abc', today)])
+
+    def test_errors(self):
+        G(SimpleDemoModel, n=2, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=[Column('char'), ColumnCallable(get_error)],
+                                      columnar=True)
+        self.assertIsInstance(ds[0]['get_error'], RowValueError)
+
+    def test_empty(self):
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columnar=True)
+        self.assertSequenceEqual(list(ds), [])
+        self.assertFalse(ds.get_data())
+
+    def test_pickle(self):
+        G(SimpleDemoModel, n=2, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char', 'integer1'], columnar=True)
+        data = pickle.loads(pickle.dumps(ds.get_data()))
+        self.assertSequenceEqual(list(data), list(ds))
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 from decimal import Decimal
 from unittest import TestCase
+import operator
+import mock
 from six import text_type
 
 from ereports.engine.columns import Column, normalize_name, get_column_for_attribute, CharColumn, \
     IntegerColumn, DateColumn, DecimalColumn, RowValue, BooleanColumn, CalcColumn, ColumnCallable, OptionalColumn, \
-    StringFormatColumn
+    StringFormatColumn, RowValueError
 from ereports.tests.app.models import DemoModel, DemoModelGroup, SimpleDemoModel
 from ereports.tests.app.reports import SimpleDemoModelSource
 
@@ -189,6 +191,31 @@ class TestCalcColumn(TestCase):
         col.initial = 10
         self.assertEqual(col.get_value(SimpleDemoModel(integer1=5), ds), 15)
 
+    def test_get_cells(self):
+        ds = SimpleDemoModelSource.as_datasource()
+        col = CalcColumn(['integer1', 'integer2'], manipulator=lambda v: v * 2)
+        objects = [SimpleDemoModel(integer1=i, integer2=10) for i in range(3)]
+        expected = [col.apply_manipulator(col.get_value(obj, ds)) for obj in objects]
+
+        self.assertEqual(col.get_cells(objects, ds), expected)
+        with mock.patch('ereports.engine.columns.numpy', None):
+            self.assertEqual(col.get_cells(objects, ds), expected)
+
+        col.op = operator.mul
+        col.initial = 1
+        self.assertEqual(col.get_cells(objects, ds), [0, 20, 40])
+
+    def test_get_cells_fallback(self):
+        ds = SimpleDemoModelSource.as_datasource()
+        col = CalcColumn(['integer1', 'integer2'])
+        objects = [SimpleDemoModel(integer1=2 ** 62, integer2=2 ** 62), SimpleDemoModel(integer1=1, integer2=None)]
+        cells = col.get_cells(objects, ds)
+        self.assertEqual(cells[0], 2 ** 63)
+        self.assertIsInstance(cells[1], RowValueError)
+
+        col = CalcColumn(['wrong', 'integer1'])
+        self.assertIsInstance(col.get_cells(objects, ds)[0], RowValueError)
+
 
 class TestColumnCallable(TestCase):
     def test_init(self):
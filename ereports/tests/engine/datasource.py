@@ -1,18 +1,68 @@
 from django.contrib.auth.models import Permission
 from django.core.exceptions import ImproperlyConfigured
 from django.contrib.auth.models import User
+from django.core import cache
+from django.db import connections
+from django.db.models import Q
 from django.test.testcases import TestCase
 from django_dynamic_fixture import G
 import itertools
+from multiprocessing.pool import Pool, ThreadPool
+import pickle
 import mock
 from ereports.engine.cache import DummyCacheManager, DatasourceCacheManager
-from ereports.engine.columns import Column, CalcColumn, ColumnCallable, BooleanColumn, OptionalColumn
-from ereports.engine.datasource import Datasource, RecordFilteredError
+from ereports.engine.columns import Column, CalcColumn, ColumnCallable, BooleanColumn, OptionalColumn, RowValue, \
+    IntegerColumn
+from ereports.engine.datasource import Datasource, RecordFilteredError, DatasourceRow, LazyCell, RawSQLDatasource
+from ereports.engine.report import BaseReport
 from ereports.tests import app
 from ereports.tests.app.models import SimpleDemoModel, DemoOptionalModel
 from ereports.utils import get_verbose_name
 
 
+class SerialPool(object):
+    """
+        processes the partitions in the current thread, to share the test database connection
+    """
+    def __init__(self, processes):
+        self.processes = processes
+
+    def map(self, func, iterable):
+        return [func(item) for item in iterable]
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+def share_connection(conn):
+    connections['default'] = conn
+
+
+class SharedThreadPool(ThreadPool):
+    """
+        thread pool whose threads use the test database connection (in memory)
+    """
+    def __init__(self, processes):
+        conn = connections['default']
+        conn.allow_thread_sharing = True
+        super(SharedThreadPool, self).__init__(processes, initializer=share_connection, initargs=(conn, ))
+
+
+def get_double(obj, datasource):
+    return obj.integer1 * 2
+
+
+def is_odd(row):
+    return row.id.value % 2 == 1
+
+
+def fail(value):
+    raise ValueError(value)
+
+
 def test_get_verbose_name():
     l = get_verbose_name(SimpleDemoModel, 'char')
     assert l == 'Character'
@@ -144,6 +194,223 @@ class TestDatasource(TestCase):
         assert ds._get_queryset.call_count == 1
         assert ds._create_result_cache.call_count == 1
 
+    def test_custom_filter_return_false(self):
+        instances = G(SimpleDemoModel, n=6, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'])
+        ds.add_custom_filter(lambda row: row.id.value % 2 == 1)
+        self.assertSequenceEqual(ds, [(i.pk,) for i in instances if i.pk % 2])
+
+    def test_batch_custom_filter(self):
+        instances = G(SimpleDemoModel, n=6, char='abc')
+        odd = [(i.pk,) for i in instances if i.pk % 2]
+
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'], chunk_size=4)
+        ds.add_custom_filter(lambda rows: [row.id.value % 2 == 1 for row in rows], batch=True)
+        self.assertFalse(ds._can_push_down())
+        self.assertSequenceEqual(ds, odd)
+        self.assertSequenceEqual(list(ds.stream()), odd)
+
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'])
+        ds.add_custom_filter(lambda rows: [row for row in rows if row.id.value % 2], batch=True)
+        self.assertSequenceEqual(ds, odd)
+
+    def test_filter_records(self):
+        instances = G(SimpleDemoModel, n=6, char='abc')
+
+        class OddDatasource(Datasource):
+            def filter_records(self, objects):
+                return [obj for obj in objects if obj.pk % 2]
+
+        class FalseDatasource(Datasource):
+            def filter_record(self, obj):
+                return bool(obj.pk % 2)
+
+        for klass in (OddDatasource, FalseDatasource):
+            ds = klass.as_datasource(model=SimpleDemoModel, columns=['id'])
+            self.assertFalse(ds._can_push_down())
+            self.assertSequenceEqual(ds, [(i.pk,) for i in instances if i.pk % 2])
+        self.assertTrue(Datasource.as_datasource(model=SimpleDemoModel, columns=['id'])._can_push_down())
+
+    def test_declarative_filters(self):
+        instances = G(SimpleDemoModel, n=6, char='abc')
+        pks = [i.pk for i in instances]
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'])
+        ds.add_custom_filter(Q(pk__in=pks[:4]))
+        ds.add_custom_filter({'pk__gt': pks[1]})
+        self.assertTrue(ds._can_push_down())
+        self.assertEqual(ds.get_python_filters(), [])
+        with self.assertNumQueries(1):
+            self.assertEqual(len(ds), 2)
+        self.assertSequenceEqual(ds, [(pks[2],), (pks[3],)])
+        self.assertEqual(ds.filter_stats, {})
+
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'])
+        ds.add_custom_filter({'pk__lt': pks[3]})
+        ds.add_custom_filter({'pk__lt': pks[5]})
+        self.assertSequenceEqual(ds, [(pk,) for pk in pks[:3]])
+
+        class FilteredDatasource(Datasource):
+            query_filters = (Q(pk__in=pks[:4]), {'pk__gt': pks[1]})
+
+        ds = FilteredDatasource.as_datasource(model=SimpleDemoModel, columns=['id'])
+        self.assertSequenceEqual(ds, [(pks[2],), (pks[3],)])
+
+    def test_filter_stats(self):
+        instances = G(SimpleDemoModel, n=6, char='abc')
+
+        class OddDatasource(Datasource):
+            def filter_record(self, obj):
+                return bool(obj.pk % 2)
+
+        def below_last(rows):
+            return [row.id.value < instances[-1].pk for row in rows]
+
+        ds = OddDatasource.as_datasource(model=SimpleDemoModel, columns=['id'])
+        ds.add_custom_filter(below_last, batch=True)
+        self.assertEqual(ds.get_python_filters(), ['filter_record', 'below_last'])
+        list(ds)
+        odd = len([i for i in instances if i.pk % 2])
+        self.assertEqual(ds.filter_stats, {'filter_record': 6 - odd,
+                                           'below_last': 1 if instances[-1].pk % 2 else 0})
+
+        # slices are not counted, each run counts from 0
+        ds = OddDatasource.as_datasource(model=SimpleDemoModel, columns=['id'])
+        ds[2]
+        self.assertEqual(ds.filter_stats, {})
+        list(ds.stream())
+        list(ds)
+        self.assertEqual(ds.filter_stats, {'filter_record': 6 - odd})
+
+    def test_clone(self):
+        G(SimpleDemoModel, n=3, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char'], extras={'a': 1})
+        ds.add_filters(char='abc')
+        ds.add_custom_filter(lambda row: True)
+        list(ds)
+
+        clone = ds._clone()
+        self.assertIsNone(clone._result_cache)
+        self.assertIsNone(clone._queryset)
+        self.assertIs(clone.columns[0], ds.columns[0])
+        self.assertEqual(clone.kwfilters, ds.kwfilters)
+        self.assertEqual(clone.extras, {'a': 1})
+
+        clone.add_filters(Q(pk=0), id__gt=0)
+        clone.add_custom_filter(lambda row: False)
+        clone.extras['b'] = 2
+        self.assertEqual(ds.kwfilters, {'char': 'abc'})
+        self.assertEqual(ds.filters, [])
+        self.assertEqual(len(ds._custom_filters), 1)
+        self.assertEqual(ds.extras, {'a': 1})
+        self.assertEqual(len(ds), 3)
+        self.assertEqual(len(clone), 0)
+        self.assertEqual(ds._clone(extras={'c': 3}).extras, {'c': 3})
+
+    def test_errors(self):
+        G(SimpleDemoModel, n=8, char='abc')
+
+        def broken(obj, ds):
+            raise KeyError
+
+        ds = Datasource.as_datasource(model=SimpleDemoModel,
+                                      columns=['id', Column('missing'), ColumnCallable(broken)])
+        with mock.patch('ereports.engine.datasource.logger') as logger:
+            list(ds)
+        self.assertEqual(ds.errors.items(), [('broken', 'ValueError', 8), ('missing', 'ValueError', 8)])
+        self.assertEqual(ds.errors.total, 16)
+        self.assertEqual(len(ds.errors.samples), ds.errors.max_samples)
+        self.assertEqual(logger.error.call_count, 1)
+
+        clone = ds._clone()
+        self.assertFalse(clone.errors)
+        with mock.patch('ereports.engine.datasource.logger') as logger:
+            list(clone.stream())
+        self.assertEqual(clone.errors.total, 16)
+        self.assertEqual(logger.error.call_count, 1)
+
+    def test_len(self):
+        G(SimpleDemoModel, n=5, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char'])
+        with self.assertNumQueries(2):
+            self.assertEqual(len(ds), 5)
+            self.assertTrue(ds)
+        self.assertIsNone(ds._result_cache)
+        empty = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'])
+        empty.add_filters(Q(pk=0))
+        self.assertFalse(empty)
+
+        list(ds)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(ds), 5)
+            self.assertTrue(ds)
+
+    def test_len_custom_filter(self):
+        G(SimpleDemoModel, n=5, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char'])
+
+        def filter_all(row):
+            raise RecordFilteredError
+
+        ds.add_custom_filter(filter_all)
+        self.assertEqual(len(ds), 0)
+        self.assertFalse(ds)
+        self.assertIsNotNone(ds._result_cache)
+
+    def test_getitem(self):
+        instances = G(SimpleDemoModel, n=5, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char'])
+        with self.assertNumQueries(2):
+            self.assertEqual(ds[1], (instances[1].pk, u'abc'))
+            self.assertSequenceEqual(ds[1:3], [(instances[1].pk, u'abc'), (instances[2].pk, u'abc')])
+        self.assertIsNone(ds._result_cache)
+        with self.assertRaises(IndexError):
+            ds[10]
+        self.assertEqual(ds[-1], (instances[4].pk, u'abc'))
+        self.assertIsNotNone(ds._result_cache)
+
+    def test_getitem_custom_filter(self):
+        instances = G(SimpleDemoModel, n=10, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'], chunk_size=2)
+
+        def filter_odd(row):
+            if not row.id.value % 2:
+                raise RecordFilteredError
+
+        ds.add_custom_filter(filter_odd)
+        odd = [(i.pk,) for i in instances if i.pk % 2]
+        self.assertEqual(ds[2], odd[2])
+        self.assertSequenceEqual(ds[1:4], odd[1:4])
+        self.assertSequenceEqual(ds[3:], odd[3:])
+        self.assertIsNone(ds._result_cache)
+
+    def test_stream(self):
+        instances = G(SimpleDemoModel, n=5, char='abc')
+        ds = Datasource.as_datasource(queryset=SimpleDemoModel.objects.all(),
+                                      columns=['id', 'char'])
+        rows = list(ds.stream(chunk_size=2))
+        self.assertSequenceEqual(rows, [(i.pk, u'abc') for i in instances])
+        self.assertIsNone(ds._result_cache)
+
+    def test_stream_custom_filter(self):
+        G(SimpleDemoModel, n=10, char='abc')
+        app.models.counter = itertools.count()
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=[Column('filter_source')])
+
+        def filter_odd(row):
+            if not row.filter_source.value % 2:
+                raise RecordFilteredError
+
+        ds.add_custom_filter(filter_odd)
+        self.assertSequenceEqual(list(ds.stream(chunk_size=3)), [(1,), (3,), (5,), (7,), (9,)])
+
+    def test_streaming(self):
+        G(SimpleDemoModel, n=3, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char'], streaming=True)
+        ds._create_result_cache = mock.Mock(wraps=ds._create_result_cache)
+        rows = [row for row in ds]
+        assert ds._create_result_cache.call_count == 0
+        self.assertSequenceEqual(rows, [(u'abc',), (u'abc',), (u'abc',)])
+
 
 class TestColumns(TestCase):
     def test_custom_column_callable(self):
@@ -203,3 +470,211 @@ class TestColumns(TestCase):
                                       columns=[Column('name'), OptionalColumn('user.first_name')])
         self.assertSequenceEqual([c.title for c in ds.columns], ['name', 'first name'])
         self.assertSequenceEqual(ds, [('abc', '',), ('abc', '')])
+
+
+class TestParallel(TestCase):
+    def test_pk_partitions(self):
+        G(SimpleDemoModel, n=10, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char'], workers=3, pool_class=SerialPool)
+        partitions = ds._get_partitions(ds._get_queryset())
+        self.assertEqual(len(partitions), 3)
+        self.assertEqual(sum(qs.count() for qs in partitions), 10)
+        self.assertSequenceEqual(list(ds), list(Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char'],
+                                                                         order_by=['pk'])))
+
+    def test_ordered_partitions(self):
+        for i in range(7):
+            G(SimpleDemoModel, char='abc', integer1=i % 3)
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'integer1'],
+                                      order_by=['-integer1'], workers=3, pool_class=SerialPool)
+        partitions = ds._get_partitions(ds._get_queryset())
+        self.assertSequenceEqual([len(qs) for qs in partitions], [3, 3, 1])
+        self.assertSequenceEqual(partitions[0].query.order_by, ['-integer1', 'pk'])
+        self.assertSequenceEqual(list(ds), list(Datasource.as_datasource(model=SimpleDemoModel,
+                                                                         columns=['id', 'integer1'],
+                                                                         order_by=['-integer1', 'id'])))
+
+    def test_empty(self):
+        ds = Datasource.as_datasource(model=SimpleDemoModel, workers=3, pool_class=SerialPool)
+        self.assertSequenceEqual(list(ds), [])
+
+    def test_columnar(self):
+        G(SimpleDemoModel, n=5, char='abc', integer1=1)
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char', 'integer1'], workers=2,
+                                      pool_class=SerialPool, columnar=True)
+        self.assertEqual(ds.get_data().sum('integer1'), 5)
+
+    def test_sliced(self):
+        G(SimpleDemoModel, n=6, char='abc')
+        qs = SimpleDemoModel.objects.order_by('char')[1:5]
+        ds = Datasource.as_datasource(queryset=qs, columns=['id'], workers=2, pool_class=SerialPool)
+        self.assertSequenceEqual(ds._get_partitions(ds._get_queryset()), [ds._get_queryset()])
+        self.assertEqual(len(ds), 4)
+
+        qs = SimpleDemoModel.objects.order_by('pk')[1:5]
+        ds = Datasource.as_datasource(queryset=qs, columns=['id'], workers=2, pool_class=SerialPool)
+        self.assertSequenceEqual([len(p) for p in ds._get_partitions(ds._get_queryset())], [2, 2])
+        self.assertSequenceEqual([row.id.value for row in ds], [obj.pk for obj in qs])
+
+    def test_threads(self):
+        G(SimpleDemoModel, n=10, char='abc', integer1=1)
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'integer1'], workers=3,
+                                      pool_class=SharedThreadPool)
+        conn = connections['default']
+        try:
+            with mock.patch.object(conn, 'close') as close:
+                self.assertEqual(sum(row.integer1.value for row in ds), 10)
+            self.assertEqual(close.call_count, 3)
+        finally:
+            conn.allow_thread_sharing = False
+
+    def test_processes(self):
+        G(SimpleDemoModel, n=10, char='abc', integer1=1)
+        ds = Datasource.as_datasource(model=SimpleDemoModel, workers=2, pool_class=Pool,
+                                      columns=['id', ColumnCallable(get_double, name='double'),
+                                               Column('integer1', manipulator=fail)])
+        ds.add_custom_filter(is_odd)
+        rows = list(ds)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(sum(row.double.value for row in rows), 10)
+        self.assertIs(rows[0].double.column, ds.columns[1])
+        self.assertIs(rows[0]._header, ds._get_row_header())
+        self.assertEqual(ds.errors.total, 10)
+        self.assertEqual(ds.filter_stats, {'is_odd': 5})
+
+    def test_pickle(self):
+        G(SimpleDemoModel, char='abc')
+        ds = Datasource.as_datasource(queryset=SimpleDemoModel.objects.all(), columns=['id', 'char'])
+        self.assertIsNone(pickle.loads(pickle.dumps(ds)).queryset)
+        self.assertEqual(pickle.loads(pickle.dumps(ds.columns[1]))._getters, {})
+
+
+class TestRawSQLDatasource(TestCase):
+    sql = "SELECT char, SUM(integer1) AS total FROM {0} WHERE integer1 > %s GROUP BY char ORDER BY char".format(
+        SimpleDemoModel._meta.db_table)
+
+    def test_rows(self):
+        G(SimpleDemoModel, n=2, char='abc', integer1=1)
+        G(SimpleDemoModel, n=3, char='xyz', integer1=10)
+        G(SimpleDemoModel, n=1, char='xyz', integer1=-1)
+        ds = RawSQLDatasource.as_datasource(sql=self.sql, params=[0], chunk_size=1,
+                                            columns=['char', ('total', IntegerColumn)])
+        self.assertSequenceEqual([c.name for c in ds.columns], ['char', 'total'])
+        self.assertIsInstance(ds.columns[1], IntegerColumn)
+        with self.assertNumQueries(1):
+            self.assertSequenceEqual(list(ds.stream()), [(u'abc', 2), (u'xyz', 30)])
+        with self.assertNumQueries(1):
+            self.assertEqual(ds[1], (u'xyz', 30))
+        with self.assertNumQueries(1):
+            self.assertSequenceEqual(ds, [(u'abc', 2), (u'xyz', 30)])
+        with self.assertNumQueries(0):
+            self.assertEqual(len(ds), 2)
+
+    def test_improperly_configured(self):
+        with self.assertRaises(ImproperlyConfigured):
+            RawSQLDatasource.as_datasource(sql=self.sql)
+        with self.assertRaises(ImproperlyConfigured):
+            RawSQLDatasource.as_datasource(sql=self.sql, columns=['char']).add_filters(char='abc')
+        with self.assertRaises(ImproperlyConfigured):
+            RawSQLDatasource.as_datasource(sql=self.sql, columns=['char']).add_custom_filter(Q(char='abc'))
+        with self.assertRaises(ImproperlyConfigured):
+            RawSQLDatasource.as_datasource(sql=self.sql, columns=['char']).get_query_plan()
+        ds = RawSQLDatasource.as_datasource(sql=self.sql, params=[0], columns=['char'])
+        with self.assertRaises(ImproperlyConfigured):
+            BaseReport.as_report(datasource=ds, list_filter=['char'])
+        self.assertEqual(BaseReport.as_report(datasource=ds).datasource.sql, self.sql)
+
+    def test_cache(self):
+        locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            locmem_cache.clear()
+            record = G(SimpleDemoModel, char='abc', integer1=1)
+            ds = RawSQLDatasource.as_datasource(sql=self.sql, params=[0], use_cache=True,
+                                                columns=['char', 'total'],
+                                                dependent_tables=[SimpleDemoModel._meta.db_table])
+            self.assertEqual(ds.dependent_models, [SimpleDemoModel])
+            list(ds)
+            with self.assertNumQueries(0):
+                list(RawSQLDatasource.as_datasource(sql=self.sql, params=[0], use_cache=True,
+                                                    columns=['char', 'total'],
+                                                    dependent_tables=[SimpleDemoModel._meta.db_table]))
+            with self.assertNumQueries(1):
+                list(RawSQLDatasource.as_datasource(sql=self.sql, params=[5], use_cache=True,
+                                                    columns=['char', 'total'],
+                                                    dependent_tables=[SimpleDemoModel._meta.db_table]))
+            record.integer1 = 2
+            record.save()
+            ds = RawSQLDatasource.as_datasource(sql=self.sql, params=[0], use_cache=True,
+                                                columns=['char', 'total'],
+                                                dependent_tables=[SimpleDemoModel._meta.db_table])
+            self.assertSequenceEqual(ds, [(u'abc', 2)])
+
+
+class TestDatasourceRow(TestCase):
+    def test_api(self):
+        row = DatasourceRow([('char', RowValue('abc')), ('integer1', RowValue(1))])
+        self.assertEqual(row['char'], 'abc')
+        self.assertEqual(row.integer1, 1)
+        self.assertEqual(row.items(), [('char', 'abc'), ('integer1', 1)])
+        self.assertEqual(row.keys(), ['char', 'integer1'])
+        self.assertEqual(row.values(), ['abc', 1])
+        self.assertEqual(list(row), ['char', 'integer1'])
+        self.assertEqual(row, ('abc', 1))
+        self.assertIn('char', row)
+        with self.assertRaises(KeyError):
+            row['wrong']
+        with self.assertRaises(AttributeError):
+            row.wrong
+
+        row['integer1'] = RowValue(2)
+        row['extra'] = RowValue(3)
+        self.assertEqual(row, ('abc', 2, 3))
+
+    def test_shared_header(self):
+        G(SimpleDemoModel, n=3, char='abc')
+        rows = list(Datasource.as_datasource(model=SimpleDemoModel, columns=['char', 'integer1']))
+        self.assertIs(rows[0]._header, rows[2]._header)
+        self.assertFalse(hasattr(rows[0]['char'], '__dict__'))
+
+        unpickled = pickle.loads(pickle.dumps(rows))
+        self.assertIs(unpickled[0]._header, unpickled[2]._header)
+        self.assertSequenceEqual(unpickled, rows)
+        self.assertEqual(unpickled[0]._original, rows[0]._original)
+
+    def test_lazy_cells(self):
+        G(SimpleDemoModel, n=2, char='abc', integer1=1)
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char', 'integer1'], required_columns=['char'])
+        rows = list(ds)
+        self.assertIsInstance(rows[0]._values[1], LazyCell)
+        self.assertEqual(rows[0].integer1, 1)
+        self.assertNotIsInstance(rows[0]._values[1], LazyCell)
+        self.assertEqual(rows[1].items(), [('char', u'abc'), ('integer1', 1)])
+
+        unpickled = pickle.loads(pickle.dumps(list(Datasource.as_datasource(model=SimpleDemoModel,
+                                                                          columns=['char', 'integer1'],
+                                                                          required_columns=['char']))))
+        self.assertSequenceEqual([row._values for row in unpickled], [row._values for row in rows])
+
+    def test_lazy_cells_errors(self):
+        G(SimpleDemoModel, n=2, char='abc', integer1=1)
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char', Column('integer1', manipulator=fail)],
+                                      required_columns=['char'])
+        rows = list(ds)
+        self.assertEqual(ds.errors.total, 0)
+        with mock.patch('ereports.engine.datasource.logger') as logger:
+            rows[0].get('integer1')
+        self.assertEqual(ds.errors.total, 1)
+        self.assertEqual(logger.error.call_args[0][1:], ('Datasource', 'integer1', 'ValueError'))
+
+    def test_stored_cells(self):
+        G(SimpleDemoModel, n=2, char='abc', integer1=1)
+        locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        locmem_cache.clear()
+        for options in ({'columnar': True}, {'spill_threshold': 1}, {'use_cache': True}):
+            ds = Datasource.as_datasource(model=SimpleDemoModel, required_columns=['char'],
+                                          columns=['char', Column('integer1', manipulator=fail)], **options)
+            with mock.patch('ereports.engine.datasource.logger') as logger:
+                with mock.patch('ereports.engine.cache._cache', locmem_cache):
+                    ds.get_data()
+            self.assertEqual(ds.errors.total, 2, options)
+            self.assertIn('integer1 ValueError x2', logger.error.call_args[0][2], options)
@@ -0,0 +1,111 @@
+import datetime
+from django.core import cache
+from django.db.models import Q
+from django_dynamic_fixture import G
+import mock
+from django.test.testcases import TestCase
+from ereports.engine.cache import DatasourceCacheManager
+from ereports.engine.columns import Column, DecimalColumn
+from ereports.engine.datasource import Datasource
+from ereports.engine.fingerprint import canonical, get_datasource_fingerprint, get_report_fingerprint, \
+    FingerprintError
+from ereports.tests.app.models import SimpleDemoModel
+from ereports.tests.app.reports import SimpleDemoReport
+
+
+def above(value):
+    def _filter(row):
+        return row.integer1.value > value
+    return _filter
+
+
+class Threshold(object):
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, row):
+        return row.integer1.value > self.value
+
+    def check(self, row):
+        return self(row)
+
+
+def get_datasource(*columns, **kwargs):
+    return Datasource.as_datasource(model=SimpleDemoModel, columns=list(columns or ['id', 'char']), **kwargs)
+
+
+class TestFingerprint(TestCase):
+    def test_canonical(self):
+        self.assertEqual(canonical([1, 'a']), canonical((1, u'a')))
+        self.assertNotEqual(canonical(['1']), canonical([1]))
+        self.assertNotEqual(canonical([True]), canonical([1]))
+        self.assertNotEqual(canonical([1, 2]), canonical([2, 1]))
+        self.assertEqual(canonical([1, 2], ordered=False), canonical([2, 1], ordered=False))
+        self.assertEqual(canonical(~Q(a=1) | Q(b__in=[1, 2])), canonical(Q(b__in=[1, 2]) | ~Q(a=1)))
+        self.assertNotEqual(canonical(~Q(a=1)), canonical(Q(a=1)))
+        self.assertEqual(canonical(datetime.date(2014, 1, 2)), ['date', '2014-01-02'])
+
+    def test_columns(self):
+        self.assertEqual(get_datasource_fingerprint(get_datasource()), get_datasource_fingerprint(get_datasource()))
+        self.assertNotEqual(get_datasource_fingerprint(get_datasource(Column('integer1'))),
+                            get_datasource_fingerprint(get_datasource(DecimalColumn('integer1'))))
+        self.assertNotEqual(get_datasource_fingerprint(get_datasource(Column('char', manipulator=str.upper))),
+                            get_datasource_fingerprint(get_datasource(Column('char', manipulator=str.lower))))
+
+    def test_filters(self):
+        ds1, ds2 = get_datasource(), get_datasource()
+        ds1.add_filters(Q(integer1=1), Q(integer2=2), char='a', boolean=True)
+        ds2.add_filters(Q(integer2=2), Q(integer1=1), boolean=True)
+        ds2.add_filters(char=u'a')
+        self.assertEqual(get_datasource_fingerprint(ds1), get_datasource_fingerprint(ds2))
+        manager = DatasourceCacheManager()
+        self.assertEqual(manager.get_key(ds1), manager.get_key(ds2))
+
+        ds2.add_filters(pk__in=[])
+        self.assertNotEqual(get_datasource_fingerprint(ds1), get_datasource_fingerprint(ds2))
+
+    def test_order_by_extras(self):
+        self.assertNotEqual(get_datasource_fingerprint(get_datasource(order_by=['id', 'char'])),
+                            get_datasource_fingerprint(get_datasource(order_by=['char', 'id'])))
+        self.assertNotEqual(get_datasource_fingerprint(get_datasource(extras={'a': 1})),
+                            get_datasource_fingerprint(get_datasource(extras={'a': 2})))
+
+    def test_report(self):
+        report = SimpleDemoReport.as_report()
+        self.assertEqual(get_report_fingerprint(report, {'order_by': ['char']}),
+                         get_report_fingerprint(SimpleDemoReport.as_report(), {'order_by': ['char']}))
+        self.assertNotEqual(get_report_fingerprint(report, {'order_by': ['char']}),
+                            get_report_fingerprint(report, {'order_by': ['-char']}))
+        report.datasource.add_filters(char='a')
+        self.assertNotEqual(get_report_fingerprint(report), get_report_fingerprint(SimpleDemoReport.as_report()))
+
+    def test_closures(self):
+        self.assertNotEqual(canonical(above(0)), canonical(above(3)))
+        self.assertEqual(canonical(above(3)), canonical(above(3)))
+        ds1, ds2 = get_datasource(), get_datasource()
+        ds1.add_custom_filter(above(0))
+        ds2.add_custom_filter(above(3))
+        self.assertNotEqual(get_datasource_fingerprint(ds1), get_datasource_fingerprint(ds2))
+
+    def test_closures_cached_rows(self):
+        for i in range(5):
+            G(SimpleDemoModel, integer1=i)
+        locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            ds1 = get_datasource('integer1', use_cache=True)
+            ds1.add_custom_filter(above(0))
+            self.assertEqual([r.integer1 for r in ds1], [1, 2, 3, 4])
+            ds2 = get_datasource('integer1', use_cache=True)
+            ds2.add_custom_filter(above(3))
+            self.assertEqual([r.integer1 for r in ds2], [4])
+
+    def test_no_canonical_form(self):
+        threshold = Threshold(1)
+        self.assertRaises(FingerprintError, canonical, threshold)
+        self.assertRaises(FingerprintError, canonical, threshold.check)
+        self.assertEqual(canonical(Threshold.check), canonical(Threshold.check))
+        self.assertEqual(canonical(len), ['callable', canonical(len)[1]])
+
+        ds = get_datasource()
+        ds.add_custom_filter(threshold.check)
+        self.assertIsNone(DatasourceCacheManager().get_key(ds))
@@ -0,0 +1,111 @@
+import pickle
+import mock
+from django.contrib.auth.models import User
+from django.test.testcases import TestCase
+from django_dynamic_fixture import G
+import operator
+from ereports.engine.columns import Column, ColumnCallable, OptionalColumn, CalcColumn
+from ereports.engine.datasource import Datasource
+from ereports.engine.planner import QueryPlan, ValuesRecord
+from ereports.tests.app.models import DemoOptionalModel, SimpleDemoModel, DemoModel, SimpleDemoChildModel, \
+    DemoModelGroup
+
+
+def get_username(obj, ds):
+    return obj.user.username
+
+
+class TestQueryPlan(TestCase):
+    def test_lookups(self):
+        plan = QueryPlan(DemoOptionalModel, [Column('name'), OptionalColumn('user.first_name')])
+        self.assertSequenceEqual(plan.lookups, ['id', 'name', 'user', 'user__first_name'])
+        self.assertEqual(plan.relations, frozenset(['user']))
+        self.assertTrue(plan.projectable)
+
+    def test_unresolved(self):
+        plan = QueryPlan(SimpleDemoModel, [Column('char'), Column('filter_source'), ColumnCallable(get_username)])
+        self.assertSequenceEqual(plan.unresolved, ['filter_source', 'get_username'])
+        self.assertFalse(plan.projectable)
+
+    def test_related_lookups(self):
+        plan = QueryPlan(DemoModel, [Column('group.name'), Column('group.user.username'),
+                                     Column('m2m'), ColumnCallable(get_username)],
+                         paths=['group.user.email', 'char'])
+        self.assertSequenceEqual(plan.select_related, ('group__user',))
+        self.assertSequenceEqual(plan.prefetch_related, ('m2m',))
+
+    def test_record(self):
+        plan = QueryPlan(DemoOptionalModel, [Column('name'), Column('user.first_name')])
+        record = plan.record({'id': 1, 'name': 'abc', 'user': 2, 'user__first_name': 'user1'})
+        self.assertEqual(record.pk, 1)
+        self.assertEqual(record.user.first_name, 'user1')
+        self.assertEqual(pickle.loads(pickle.dumps(record)).user.first_name, 'user1')
+
+        record = plan.record({'id': 1, 'name': 'abc', 'user': None, 'user__first_name': None})
+        self.assertIsNone(record.user)
+        with self.assertRaises(AttributeError):
+            record.wrong
+
+    def test_datasource(self):
+        G(DemoOptionalModel, n=2, name='abc', user=G(User, first_name='user1'))
+        G(DemoOptionalModel, n=1, name='xyz', user=None)
+        columns = [Column('name'), OptionalColumn('user.first_name')]
+        ds = Datasource.as_datasource(model=DemoOptionalModel, columns=columns, use_values=True)
+        rows = list(ds)
+        self.assertIsInstance(rows[0]._original, ValuesRecord)
+        self.assertSequenceEqual(rows, list(Datasource.as_datasource(model=DemoOptionalModel, columns=columns)))
+        self.assertSequenceEqual(rows, [('abc', 'user1'), ('abc', 'user1'), ('xyz', '')])
+
+    def test_select_related_nullable(self):
+        G(DemoOptionalModel, n=3, name='abc', user=G(User, first_name='user1'))
+        ds = Datasource.as_datasource(model=DemoOptionalModel, columns=['name', 'user.first_name'])
+        self.assertSequenceEqual(ds.get_query_plan().select_related, ('user',))
+        with self.assertNumQueries(1):
+            self.assertSequenceEqual(list(ds), [('abc', 'user1')] * 3)
+
+    def test_select_related_unresolved(self):
+        for i in range(5):
+            G(DemoModelGroup, name='group%s' % i, user=G(User, username='user%s' % i))
+        ds = Datasource.as_datasource(model=DemoModelGroup, columns=['name', ColumnCallable(get_username)])
+        self.assertSequenceEqual(ds.get_query_plan().select_related, ('user',))
+        with self.assertNumQueries(1):
+            self.assertSequenceEqual([row.get_username.value for row in ds], ['user%s' % i for i in range(5)])
+
+    def test_select_related_override(self):
+        ds = Datasource.as_datasource(model=DemoOptionalModel, columns=['name', 'user.first_name'],
+                                      select_related=True)
+        self.assertTrue(ds._get_queryset().query.select_related)
+
+    def test_calc_column(self):
+        G(SimpleDemoModel, char='abc', integer1=1, integer2=None)
+        G(SimpleDemoModel, char='xyz', integer1=5, integer2=2)
+        total = CalcColumn(['integer1', 'integer1'], name='total')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, use_values=True, order_by=['-total'],
+                                      columns=['char', total, CalcColumn(['integer1', 'integer2'])])
+        plan = ds.get_query_plan()
+        self.assertSequenceEqual(plan.extra_select.keys(), ['ereports_calc_total'])
+        self.assertSequenceEqual(plan.unresolved, ['integer1integer2'])
+        self.assertEqual(plan.get_order_by(ds.order_by), ['-ereports_calc_total'])
+        with mock.patch.object(CalcColumn, '_get_value_from_attr') as get_value:
+            self.assertSequenceEqual([row.total.value for row in ds], [10, 2])
+        self.assertEqual([c[0][1] for c in get_value.call_args_list].count('integer1'), 2)  # integer1integer2 only
+
+        total.op = operator.sub
+        ds = Datasource.as_datasource(model=SimpleDemoModel, use_values=True, columns=['char', total])
+        self.assertIsInstance(ds[0]._original, ValuesRecord)
+        self.assertSequenceEqual(ds, [(u'abc', 0), (u'xyz', 0)])
+
+    def test_calc_column_inherited(self):
+        G(SimpleDemoChildModel, char='abc', integer1=1, integer2=2, extra=3)
+        columns = [CalcColumn(['integer1', 'integer1'], name='inherited'), CalcColumn(['extra', 'extra'], name='own')]
+        ds = Datasource.as_datasource(model=SimpleDemoChildModel, columns=columns)
+        self.assertSequenceEqual(ds.get_query_plan().extra_select.keys(), ['ereports_calc_own'])
+        self.assertSequenceEqual(ds, [(2, 6)])
+
+    def test_datasource_fallback(self):
+        G(DemoOptionalModel, n=1, name='abc', user=G(User, username='user1'))
+        ds = Datasource.as_datasource(model=DemoOptionalModel, use_values=True,
+                                      columns=[Column('name'), ColumnCallable(get_username)])
+        rows = list(ds)
+        self.assertIsInstance(rows[0]._original, DemoOptionalModel)
+        self.assertSequenceEqual(rows, [('abc', 'user1')])
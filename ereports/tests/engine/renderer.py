@@ -3,6 +3,7 @@ from django.http import HttpResponse
 from django_dynamic_fixture import G
 from django_webtest import WebTest
 
+from ereports.engine.columns import Column, OptionalColumn
 from ereports.engine.renderer import BaseHtmlRender, BaseXlsRender
 from ereports.tests.app.models import SimpleDemoModel
 from ereports.tests.app.reports import SimpleDemoReport, SimpleDateReport
@@ -18,6 +19,24 @@ class TestBaseHtmlRenderer(WebTest):
         r = renderer.render_to_response(request)
         self.assertIsInstance(r, HttpResponse)
 
+    def test_render_errors(self):
+        G(SimpleDemoModel, n=2, char='abc')
+        report = SimpleDemoReport.as_report()
+        report.datasource.columns.append(Column('missing'))
+        report.list_display = ['char', 'missing']
+        r = report.get_renderer_for_format('html').render_to_response(get_fake_request(), report=report)
+        self.assertIn('2 values could not be computed', r.content)
+        self.assertIn('missing: ValueError (2)', r.content)
+
+    def test_render_optional_errors(self):
+        G(SimpleDemoModel, n=2, char='abc')
+        report = SimpleDemoReport.as_report()
+        report.datasource.columns.append(OptionalColumn('missing'))
+        report.list_display = ['char', 'missing']
+        r = report.get_renderer_for_format('html').render_to_response(get_fake_request(), report=report)
+        self.assertNotIn('could not be computed', r.content)
+        self.assertEqual(report.datasource.errors.total, 2)
+
     def test_render_to_response_with_groupby(self):
         report = SimpleDateReport.as_report()
         renderer = report.get_renderer_for_format('html')
@@ -3,11 +3,14 @@ from django.contrib.auth.models import Permission
 from django_dynamic_fixture import G
 from django_webtest import WebTest
 from itertools import count
+import mock
+from decimal import Decimal
+from ereports.engine.columns import CalcColumn, Column, ColumnCallable, DecimalColumn
 from ereports.engine.config import reportform_factory
 from ereports.engine.datasource import Datasource
 from ereports.engine.renderer import BaseHtmlRender, BaseXlsRender
-from ereports.engine.report import BaseReport, BaseGrouper, ImproperlyConfigured
-from ereports.tests.app.models import SimpleDemoModel, SimpleDateModel
+from ereports.engine.report import BaseReport, BaseGrouper, StreamingGrouper, ImproperlyConfigured
+from ereports.tests.app.models import SimpleDemoModel, SimpleDateModel, DemoModel
 from ereports.tests.app.reports import SimpleDemoReport, SimpleDateReport, SimpleDateModelSource
 
 
@@ -68,6 +71,16 @@ class TestBaseGroup(WebTest):
 
         self.assertEqual(list(g.items()), expected)
 
+    def test_subtotals(self):
+        G(SimpleDemoModel, n=2, char='abc', integer1=1, integer2=2)
+        G(SimpleDemoModel, n=3, char='xyz', integer1=10, integer2=20)
+        r = BaseReport.as_report(model=SimpleDemoModel, column_totals=['integer1', 'char'])
+        g = BaseGrouper(r, 'char', 'integer1')
+        with self.assertNumQueries(2):
+            groups = dict(g.items())
+        self.assertEqual(groups[u'abc'].totals, {'integer1': 2, 'char': None})
+        self.assertEqual(groups[u'xyz'].totals, {'integer1': 30, 'char': None})
+
     def test_values(self):
         G(SimpleDateModel, char='abc', date=datetime.date.today(), date_range=datetime.date.today())
         r = SimpleDateReport.as_report()
@@ -81,6 +94,92 @@ class TestBaseGroup(WebTest):
         self.assertEqual(g.keys(), [u'abc'])
 
 
+class TestStreamingGroup(WebTest):
+    def test_items(self):
+        G(SimpleDemoModel, char='xyz', integer1=3)
+        G(SimpleDemoModel, char='abc', integer1=2)
+        G(SimpleDemoModel, char='xyz', integer1=1)
+        r = BaseReport.as_report(model=SimpleDemoModel, list_display=['char', 'integer1'],
+                                 column_totals=['integer1'])
+        g = StreamingGrouper(r, 'char', 'integer1')
+        groups = list(g.items())
+        self.assertEqual(groups, list(BaseGrouper(r, 'char', 'integer1').items()))
+        self.assertEqual(groups, [(u'abc', [(u'abc', 2)]),
+                                  (u'xyz', [(u'xyz', 1), (u'xyz', 3)])])
+        self.assertEqual([group.totals for __, group in groups], [{'integer1': 2}, {'integer1': 4}])
+
+    def test_streaming(self):
+        G(SimpleDemoModel, n=3, char='abc')
+        r = BaseReport.as_report(model=SimpleDemoModel)
+        g = StreamingGrouper(r, 'char', 'integer1')
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(g.items())), 1)
+        self.assertIsNone(r.datasource._result_cache)
+
+    def test_errors(self):
+        G(SimpleDemoModel, n=3, char='abc')
+
+        def broken(obj, ds):
+            raise KeyError
+
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char', 'integer1', ColumnCallable(broken)])
+        r = BaseReport.as_report(datasource=ds, list_display=['char', 'integer1', 'broken'])
+        with mock.patch('ereports.engine.datasource.logger'):
+            self.assertEqual(len(list(StreamingGrouper(r, 'char', 'integer1').items())), 1)
+        self.assertEqual(r.datasource.errors.items(), [('broken', 'ValueError', 3)])
+        self.assertIsNone(r.datasource._result_cache)
+
+    def test_fallback(self):
+        G(SimpleDemoModel, n=3, char='abc')
+        r = BaseReport.as_report(model=SimpleDemoModel)
+        g = StreamingGrouper(r, fake_callable, 'integer1')
+        self.assertEqual(list(g.items()), [(u'cba', list(r))])
+
+
+class TestColumnarGroup(WebTest):
+    def test_items(self):
+        G(SimpleDemoModel, char='xyz', integer1=3, integer2=1)
+        G(SimpleDemoModel, char='abc', integer1=2, integer2=1)
+        G(SimpleDemoModel, char='xyz', integer1=1, integer2=None)
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char', 'integer1', 'integer2'])
+        r = BaseReport.as_report(datasource=ds, list_display=['char', 'integer1'],
+                                 column_totals=['integer2'])
+        expected = list(BaseGrouper(r, 'char', 'integer1').items())
+
+        ds.columnar = True
+        r = BaseReport.as_report(datasource=ds, list_display=['char', 'integer1'],
+                                 column_totals=['integer2'])
+        r.datasource.add_custom_filter(lambda row: None)  # subtotals are computed by column
+        groups = list(BaseGrouper(r, 'char', 'integer1').items())
+        self.assertEqual(groups, expected)
+        self.assertEqual(groups, [(u'abc', [(u'abc', 2)]),
+                                  (u'xyz', [(u'xyz', 1), (u'xyz', 3)])])
+        self.assertEqual([group.totals for __, group in groups], [{'integer2': 1}, {'integer2': 1}])
+        self.assertEqual(r.get_totals(), {'integer2': 2})
+        self.assertEqual(r.get_column_values('integer1'), [3, 2, 1])
+
+    def test_not_columns(self):
+        G(SimpleDemoModel, char='xyz', integer1=3, integer2=1)
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['integer1'], columnar=True)
+        r = BaseReport.as_report(datasource=ds)
+        for group_by, internal_order in (('char', 'integer1'), (fake_callable, 'integer1'), ('integer1', 'char')):
+            with self.assertRaises(ImproperlyConfigured):
+                BaseGrouper(r, group_by, internal_order).items()
+
+    def test_manipulator(self):
+        G(SimpleDemoModel, char='xyz', integer1=3, integer2=1)
+        G(SimpleDemoModel, char='abc', integer1=2, integer2=1)
+        columns = [Column('char', manipulator=lambda v: v[0].upper()), 'integer1', 'integer2']
+        groups = []
+        for columnar in (False, True):
+            ds = Datasource.as_datasource(model=SimpleDemoModel, columns=columns, columnar=columnar)
+            r = BaseReport.as_report(datasource=ds, list_display=['char', 'integer1'], column_totals=['integer2'])
+            groups.append([(name, list(group), group.totals)
+                           for name, group in BaseGrouper(r, 'char', 'integer1').items()])
+        self.assertEqual(groups[0], groups[1])
+        self.assertEqual(groups[0], [(u'A', [(u'A', 2)], {'integer2': 1}), (u'X', [(u'X', 3)], {'integer2': 1})])
+
+
 class TestBaseReport(WebTest):
     def test_inherit(self):
         TestReport = type('TestReport', (BaseReport,), {'model': Permission})
@@ -159,6 +258,66 @@ class TestBaseReport(WebTest):
 
         self.assertSequenceEqual([1, 3, 5, 7, 9, 11, 13, 15, 17, 19], r.get_column_values('integer1'))
 
+    def test_get_totals(self):
+        G(SimpleDemoModel, n=10, data_fixture=SequentialDataFixture(0))
+        ds = Datasource.as_datasource(model=SimpleDemoModel)
+        r = BaseReport.as_report(datasource=ds, column_totals=['integer1', 'integer2'])
+        with self.assertNumQueries(1):
+            self.assertEqual(r.get_totals(), {'integer1': 100, 'integer2': 0})
+        with self.assertNumQueries(0):
+            self.assertEqual(r.get_totals(['integer1']), {'integer1': 100})
+
+    def test_get_totals_decimal(self):
+        G(DemoModel, n=2, float=0.1, decimal=Decimal('0.1'))
+        ds = Datasource.as_datasource(model=DemoModel, columns=[DecimalColumn('float'), DecimalColumn('decimal')])
+        r = BaseReport.as_report(datasource=ds, column_totals=['float', 'decimal'])
+        with self.assertNumQueries(1):
+            totals = r.get_totals()
+        self.assertEqual(totals, {'float': Decimal('0.2'), 'decimal': Decimal('0.2')})
+
+    def test_get_totals_calc_column(self):
+        G(SimpleDemoModel, n=2, char='abc', integer1=1)
+        G(SimpleDemoModel, n=3, char='xyz', integer1=10)
+        total = CalcColumn(['integer1', 'integer1'], name='total')
+        total.initial = 5
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char', total])
+        r = BaseReport.as_report(datasource=ds, column_totals=['total'])
+        with self.assertNumQueries(1):
+            self.assertEqual(r.get_totals(), {'total': 89})
+        self.assertEqual(r.get_totals(), {'total': sum(row.total.value for row in ds)})
+
+        g = BaseGrouper(r, 'char', 'total')
+        with self.assertNumQueries(2):
+            self.assertEqual([group.totals for __, group in g.items()], [{'total': 14}, {'total': 75}])
+
+    def test_required_columns(self):
+        G(SimpleDemoModel, n=2, char='abc', integer1=1)
+        calls = []
+
+        def get_char(obj, ds):
+            calls.append(obj)
+            return obj.char.upper()
+
+        ds = Datasource.as_datasource(model=SimpleDemoModel,
+                                      columns=['char', 'integer1', 'integer2', ColumnCallable(get_char)])
+        r = BaseReport.as_report(datasource=ds, list_display=['integer1'], order_by=['char'])
+        self.assertEqual(r.get_required_columns(), ['integer1', 'char'])
+        self.assertEqual(list(r), [(1, ), (1, )])
+        self.assertEqual(calls, [])
+
+        row = r.datasource[0]
+        self.assertEqual(row.get_char.value, u'ABC')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(row, (u'abc', 1, 0, u'ABC'))
+        self.assertEqual(len(calls), 1)
+
+    def test_get_totals_python(self):
+        G(SimpleDemoModel, n=10, data_fixture=SequentialDataFixture(0))
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char', 'integer1'])
+        ds.add_custom_filter(lambda row: None)
+        r = BaseReport.as_report(datasource=ds)
+        self.assertEqual(r.get_totals(['integer1', 'char']), {'integer1': 100, 'char': None})
+
     def test_get_config_form_class(self):
         r = SimpleDemoReport.as_report()
         f = reportform_factory(r, bases=(r.config_form_class,))
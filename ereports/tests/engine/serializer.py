@@ -0,0 +1,62 @@
+from django.core import cache
+from django.test.testcases import TestCase
+from django_dynamic_fixture import G
+import mock
+from ereports.engine import serializer
+from ereports.engine.columnar import ColumnarResult
+from ereports.engine.columns import ColumnCallable, RowValue, RowValueError
+from ereports.engine.datasource import Datasource
+from ereports.tests.app.models import SimpleDemoModel
+
+locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+
+
+def get_error(obj, ds):
+    raise AttributeError
+
+
+class TestSerializer(TestCase):
+    def test_rows(self):
+        instances = G(SimpleDemoModel, n=3, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char', ColumnCallable(get_error)])
+        rows = ds.get_data()
+        rows[0]['char'] = u'custom'
+
+        loaded = serializer.loads(serializer.dumps(rows), ds)
+        self.assertIsInstance(loaded, tuple)
+        self.assertSequenceEqual([r.values()[:2] for r in loaded], [r.values()[:2] for r in rows])
+        self.assertEqual(loaded[0].char, u'custom')
+        self.assertIs(loaded[1].char.column, ds.columns[1])
+        self.assertIs(loaded[1]._header, ds._get_row_header())
+        self.assertIsInstance(loaded[1].get_error, RowValueError)
+        self.assertEqual(loaded[2]._original, instances[2])
+
+    def test_columnar(self):
+        G(SimpleDemoModel, n=3, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char'], columnar=True)
+        result = ds.get_data()
+        loaded = serializer.loads(serializer.dumps(result), ds)
+        self.assertIsInstance(loaded, ColumnarResult)
+        self.assertSequenceEqual(list(loaded), list(result))
+        self.assertIs(loaded[0].char.column, ds.columns[1])
+
+    def test_empty(self):
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'])
+        self.assertEqual(serializer.loads(serializer.dumps(()), ds), ())
+
+    def test_invalid(self):
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'])
+        self.assertIsNone(serializer.loads('not a payload', ds))
+
+    def test_cache(self):
+        G(SimpleDemoModel, n=3, char='abc')
+        with mock.patch('ereports.engine.cache._cache', locmem_cache):
+            locmem_cache.clear()
+            ds1 = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char'], use_cache=True)
+            rows = list(ds1)
+            ds2 = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char'], use_cache=True)
+            with self.assertNumQueries(0):
+                cached = ds2.cache_manager.load(ds2)
+            self.assertSequenceEqual(cached, rows)
+            self.assertIsInstance(cached[0].char, RowValue)
+            self.assertIs(cached[0].char.column, ds2.columns[1])
@@ -0,0 +1,71 @@
+import pickle
+from django.core.exceptions import ImproperlyConfigured
+from django.test.testcases import TestCase
+from django_dynamic_fixture import G
+from ereports.engine.cache import DatasourceCacheManager
+from ereports.engine.columns import ColumnCallable, RowValueError
+from ereports.engine.datasource import Datasource
+from ereports.engine.report import BaseReport, BaseGrouper
+from ereports.engine.spill import SpilledResult
+from ereports.tests.app.models import SimpleDemoModel
+
+
+def get_error(obj, ds):
+    raise AttributeError
+
+
+class TestSpilledResult(TestCase):
+    def test_spill(self):
+        instances = G(SimpleDemoModel, n=5, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', 'char'], spill_threshold=3,
+                                      chunk_size=2)
+        result = ds.get_data()
+        self.assertIsInstance(result, SpilledResult)
+        expected = [(i.pk, u'abc') for i in instances]
+        self.assertEqual(len(ds), 5)
+        self.assertTrue(ds)
+        self.assertSequenceEqual(list(ds), expected)
+        self.assertEqual(ds[-1], expected[-1])
+        self.assertSequenceEqual(ds[1:3], expected[1:3])
+        self.assertIs(ds[0].char.column, ds.columns[1])
+        self.assertIsNone(ds[0]._original)
+        with self.assertRaises(IndexError):
+            result[5]
+        with self.assertRaises(TypeError):
+            pickle.dumps(result)
+        result.close()
+
+    def test_below_threshold(self):
+        G(SimpleDemoModel, n=3, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'], spill_threshold=3)
+        self.assertIsInstance(ds.get_data(), tuple)
+
+    def test_errors(self):
+        G(SimpleDemoModel, n=3, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id', ColumnCallable(get_error)],
+                                      spill_threshold=1)
+        self.assertIsInstance(ds.get_data(), SpilledResult)
+        self.assertIsInstance(ds[0].get_error, RowValueError)
+
+    def test_not_cached(self):
+        G(SimpleDemoModel, n=3, char='abc')
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['id'], spill_threshold=1, use_cache=True)
+        self.assertIsInstance(ds.cache_manager, DatasourceCacheManager)
+        list(ds)
+        self.assertIsNone(ds.cache_manager.load(ds))
+
+    def test_groups(self):
+        G(SimpleDemoModel, char='xyz', integer1=3)
+        G(SimpleDemoModel, char='abc', integer1=2)
+        G(SimpleDemoModel, char='xyz', integer1=1)
+        ds = Datasource.as_datasource(model=SimpleDemoModel, columns=['char', 'integer1'], spill_threshold=1)
+        r = BaseReport.as_report(datasource=ds)
+        self.assertSequenceEqual([(name, [row.integer1.value for row in group])
+                                  for name, group in BaseGrouper(r, 'char', 'integer1').items()],
+                                 [(u'abc', [2]), (u'xyz', [1, 3])])
+        self.assertIsInstance(r.datasource.get_data(), SpilledResult)
+
+        with self.assertRaises(ImproperlyConfigured):
+            BaseGrouper(r, 'integer2', 'integer1').items()
+        with self.assertRaises(ImproperlyConfigured):
+            BaseGrouper(r, 'char', 'integer2').items()
@@ -2,11 +2,14 @@
 import datetime
 
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
 from django.http import QueryDict
 from django_dynamic_fixture import G
 from django_webtest import WebTest
 from mock import patch
 
+from ereports.engine.datasource import RawSQLDatasource
+from ereports.engine.report import BaseReport
 from ereports.views import ReportIndex, ReportFilter
 from ereports.models import ReportConfiguration
 from ereports.tests.app.models import SimpleDemoModel
@@ -77,3 +80,19 @@ class TestReportFilter(WebTest):
         response = ReportFilter.as_view()(self.request, pk=self.config.pk)
         self.assertIn('ereports.engine.report.BaseReport', str(response))
         self.assertIn('Integer #1', str(response))
+
+    def test_raw_sql_filtering(self):
+        ds = RawSQLDatasource.as_datasource(sql="SELECT char FROM %s" % SimpleDemoModel._meta.db_table,
+                                            columns=['char'])
+        RawReport = type('RawReport', (BaseReport,), {'datasource': ds})
+        self.config.target_model = None
+        self.config.save()
+        with patch.object(ReportFilter, 'get_report_class', return_value=RawReport):
+            ReportFilter.as_view()(self.request, pk=self.config.pk)
+            self.config.filtering = 'char={{ today }}'
+            self.config.save()
+            self.request.method = 'POST'
+            self.request.POST = self.querydict
+            self.request.POST['_report_list_display'] = 'char'
+            with self.assertRaises(ImproperlyConfigured):
+                ReportFilter.as_view()(self.request, pk=self.config.pk)
@@ -156,6 +156,34 @@ def get_attr(obj, attr, default=None):
         return get_attr(getattr(obj, L[0], default), '.'.join(L[1:]), default)
 
 
+def attr_getter(attr, default=None):
+    """Returns a function that reads the dotted attribute `attr` from an object.
+    Same as `get_attr()` but the path is split only once.
+
+    >>> class C(object): pass
+    >>> a = C()
+    >>> a.b = C()
+    >>> a.b.c = 4
+    >>> attr_getter('b.c')(a)
+    4
+
+    >>> attr_getter('b.c.y', None)(a)
+
+    >>> attr_getter('b.c.y', 1)(a)
+    1
+    """
+    names = attr.split('.')
+    if len(names) == 1:
+        def getter(obj):
+            return getattr(obj, attr, default)
+    else:
+        def getter(obj):
+            for name in names:
+                obj = getattr(obj, name, default)
+            return obj
+    return getter
+
+
 class StartWithList(list):
     """List redefined to check list items start with particular string
 
@@ -1,10 +1,10 @@
-import hashlib
 import logging
 import datetime
 from django.contrib import messages
 from django.core.cache import cache
 from django.views.generic import TemplateView
 from ereports.engine.config import reportform_factory
+from ereports.engine.fingerprint import get_report_fingerprint, FingerprintError
 from ereports.engine.registry import registry
 from ereports.engine.report import BaseReport
 from ereports.filtering import FilterQuerysetMixin
@@ -39,7 +39,11 @@ class ReportFilter(FilterQuerysetMixin, TemplateView):
             kwargs['model'] = self.config.target_model.model_class()
 
         Class = self.get_report_class()
-        return Class.as_report(**kwargs)
+        report = Class.as_report(**kwargs)
+        if self.config.filtering and self.config.filtering.strip():
+            # the filters are applied with `add_filters()` by `finalize_filters()`
+            report.check_filterable(report.datasource)
+        return report
 
     def get_report_class(self):
         return registry.get(self.config.report_class, BaseReport)
@@ -105,16 +109,16 @@ class ReportFilter(FilterQuerysetMixin, TemplateView):
 
             filters, kwfilters = self.finalize_filters(*filters, **kwfilters)
 
-            m = hashlib.md5()
-            m.update("filters={0}".format(str(kwfilters)))
-            m.update("list_display={0}".format(str(self.report.list_display)))
-            m.update("report_attributes={0}".format(str(report_attributes)))
-
-            cache_key = m.hexdigest()
+            # the datasource fingerprint includes the filters
+            try:
+                cache_key = get_report_fingerprint(self.report, report_attributes)
+            except FingerprintError:  # not cacheable
+                cache_key = None
             context['hash'] = cache_key
-            page = cache.get(cache_key)
-            if page:
-                return page
+            if cache_key is not None:
+                page = cache.get(cache_key)
+                if page:
+                    return page
 
             context['report'] = self.report
             context['filters_legend'] = form.get_filters_summary()